@@ -1,10 +1,19 @@
-import os, re, sys, stream, helper, database, keyboard, time
-import asyncio, textwrap, threading, subprocess, logging, difflib
+import os, re, sys, helper, database, time
+import asyncio, textwrap, threading, subprocess, logging, difflib, hashlib, importlib.util
+from collections import OrderedDict
 from os.path import (abspath, basename, dirname, exists, getsize, isfile, join, relpath, isdir)
-from typing import Any, Dict, List, Optional, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 from colorama import Fore, Style
 from indexer import ProjectIndexer, DEFAULT_INDEXER_IGNORE_PATTERNS
-from voice import VoiceCommandHandler
+
+try:
+    import keyboard
+except ImportError:
+    keyboard = None
+
+if TYPE_CHECKING:
+    from voice import VoiceCommandHandler
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +23,15 @@ MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT = 10000
 MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT = 50000
 MAX_CHARS_FOR_SUMMARIZATION_INPUT = 15000
 MIN_CHARS_TO_TRIGGER_SUMMARIZATION = MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT * 1.5
+SETTINGS_FLUSH_DELAY_SECONDS = 1.0
+MAX_CONCURRENT_SUMMARIES = 4
+SUMMARY_CACHE_MAX_ENTRIES = 64
+MAX_DIFF_FILE_BYTES = 2 * 1024 * 1024
+DIFF_READ_BUFFER_BYTES = 1 << 20
+CLEAR_SCREEN_SEQUENCE = "\x1b[2J\x1b[H"
+STATUS_ON_LABEL = f"{Fore.GREEN}ON{Style.RESET_ALL}"
+STATUS_OFF_LABEL = f"{Fore.RED}OFF{Style.RESET_ALL}"
+NOT_SET_LABEL = f"{Style.DIM}Not set{Style.RESET_ALL}"
 
 class ChatBot:
     DEFAULT_IGNORE_DIRS: Set[str] = DEFAULT_INDEXER_IGNORE_PATTERNS
@@ -26,8 +44,17 @@ class ChatBot:
         self.settings: Optional[Dict[str, Any]] = database.load_settings(self.conn, default_admin_mode)
         self.last_proposed_changes: Optional[Dict[str, Dict[str, Any]]] = None
         self._voice_processing_thread: Optional[threading.Thread] = None
-        self.voice_handler: Optional[VoiceCommandHandler] = None
+        self.voice_handler: Optional["VoiceCommandHandler"] = None
+        self._voice_supported: bool = False
+        self._voice_init_attempted: bool = False
         self.hotkeys_active: bool = False
+        self._settings_lock = threading.Lock()
+        self._settings_dirty: bool = False
+        self._settings_flush_timer: Optional[threading.Timer] = None
+        self._screen_grabber: Optional[Any] = None
+        self._prompt_header_cache: Dict[bool, str] = {}
+        self._summary_cache: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._summary_cache_lock = threading.Lock()
 
         if not self.settings:
              logger.critical("Failed to load settings from database. Cannot proceed.")
@@ -60,27 +87,49 @@ class ChatBot:
             "/sudo": "Toggle Admin Mode (file ops/exec).",
             "/runtest": "Run configured test command.",
             "/reindex": "Rescan Code Folder & refresh index.",
-            "/find": "Find files by name in project."
+            "/find": "Find files by name in project.",
+            "/capture_context": "Capture screen for AI."
+        }
+        self._help_pages: Optional[List[str]] = None
+        self._command_handlers: Dict[str, Any] = {
+            "/help": self._handle_help_command,
+            "/quit": lambda a: False,
+            "/exit": lambda a: False,
+            "/clear": self._handle_clear_command,
+            "/add": self._handle_add_command,
+            "/drop": self._handle_drop_command,
+            "/list": self._handle_list_command,
+            "/apply": self._review_and_apply_changes,
+            "/discard": self._handle_discard_command,
+            "/model": self._handle_model_command,
+            "/settings": self._handle_settings_command,
+            "/codefolder": self._handle_codefolder_command,
+            "/sudo": self._handle_admin_command,
+            "/runtest": self._handle_runtest_command,
+            "/reindex": self._handle_reindex_command,
+            "/find": self._handle_find_command,
+            "/capture_context": self._handle_capture_context_command,
         }
-        if stream:
-            self.command_list["/capture_context"] = "Capture screen for AI."
 
         if keyboard:
-            self._setup_voice_input()
+            # the recognizer (and its microphone calibration) is only built on the first hotkey press;
+            # sr.Microphone needs PyAudio, so probe for it too rather than failing on that press
+            self._voice_supported = all(importlib.util.find_spec(m) is not None for m in ("speech_recognition", "pyaudio"))
             self._setup_keyboard_shortcuts()
 
         logger.info(f"ChatBot initialized. Project indexed at: {self.code_folder_path}")
 
     def _display_system_message(self, message: str) -> None:
         try:
-            print(f"{Fore.YELLOW}{message}{Style.RESET_ALL}")
+            # single write so messages from summarization workers don't interleave mid-line
+            sys.stdout.write(f"{Fore.YELLOW}{message}{Style.RESET_ALL}\n")
         except Exception as e:
             logger.error(f"Error displaying system message ('{message}'): {e}", exc_info=True)
             print(f"System: {message}")
 
     def _display_error(self, message: str) -> None:
         try:
-            print(f"{Fore.RED}{Style.BRIGHT}Error: {message}{Style.RESET_ALL}")
+            sys.stdout.write(f"{Fore.RED}{Style.BRIGHT}Error: {message}{Style.RESET_ALL}\n")
         except Exception as e:
             logger.error(f"Error displaying error message itself ('{message}'): {e}", exc_info=True)
             print(f"Error: {message}")
@@ -112,9 +161,51 @@ class ChatBot:
             logger.error(f"Error displaying prompt: {e}", exc_info=True)
             print(f"\nError displaying prompt. Check logs. {self.USERNAME}: ", end="")
 
-    def _summarize_content_if_needed(self, file_rel_path: str, full_content: str) -> Tuple[str, bool]:
+    def _update_settings(self, changes: Dict[str, Any]) -> None:
+        if not self.settings:
+            logger.error("Settings not loaded, cannot update settings.")
+            return
+        with self._settings_lock:
+            self.settings.update(changes)
+            self._settings_dirty = True
+            if self._settings_flush_timer is None:
+                self._settings_flush_timer = threading.Timer(SETTINGS_FLUSH_DELAY_SECONDS, self._flush_settings)
+                self._settings_flush_timer.daemon = True
+                self._settings_flush_timer.start()
+
+    def _flush_settings(self) -> None:
+        with self._settings_lock:
+            if self._settings_flush_timer is not None:
+                self._settings_flush_timer.cancel()
+                self._settings_flush_timer = None
+            if not self._settings_dirty or not self.settings:
+                return
+            database.save_settings(self.conn, self.settings)
+            self._settings_dirty = False
+
+    def _summarize_content_if_needed(self, file_rel_path: str, full_content: str,
+                                     deferred_notices: Optional[List[Tuple[str, bool]]] = None) -> Tuple[str, bool]:
+        # on summarize-* workers the (message, is_error) notices are collected for the prompt loop to print in order
+        def notify(message: str, is_error: bool = False) -> None:
+            if deferred_notices is not None:
+                deferred_notices.append((message, is_error))
+            elif is_error:
+                self._display_error(message)
+            else:
+                self._display_system_message(message)
+
         if len(full_content) > MIN_CHARS_TO_TRIGGER_SUMMARIZATION and self.settings:
-            self._display_system_message(f"Content of '{file_rel_path}' ({len(full_content)} chars) is large. Attempting summarization...")
+            # pinned files are re-sent every turn; only re-summarize when the content (or model) changed
+            summary_cache_key = (file_rel_path, self.settings.get('model_name', 'gemini'), hashlib.blake2b(full_content.encode('utf-8', errors='replace'), digest_size=16).hexdigest())
+            with self._summary_cache_lock:
+                cached_summary = self._summary_cache.get(summary_cache_key)
+                if cached_summary is not None:
+                    self._summary_cache.move_to_end(summary_cache_key)
+            if cached_summary is not None:
+                logger.debug(f"Reusing cached summary for {file_rel_path}.")
+                return f"[Summarized Content of {file_rel_path}]:\n{cached_summary}", True
+
+            notify(f"Content of '{file_rel_path}' ({len(full_content)} chars) is large. Attempting summarization...")
             summarization_prompt = (
                 f"Summarize the following content from the file '{file_rel_path}'. "
                 f"Focus on the core logic, main functionalities, and purpose of the code or text. "
@@ -133,23 +224,70 @@ class ChatBot:
                     logger.warning(f"Summarization model '{self.settings.get('model_name')}' unavailable, using '{summarization_model_client}' for summarization.")
                 else:
                     logger.error("No models available for summarization. Returning truncated content.")
-                    self._display_error("Failed to summarize: No AI models available.")
+                    notify("Failed to summarize: No AI models available.", is_error=True)
                     return full_content[:MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT], False
 
             summary = helper.chat_with_model([summarization_prompt], model_name=summarization_model_client, mode_hint='conversation')
 
             if summary and not summary.startswith("Error:"):
-                self._display_system_message(f"Summarized '{file_rel_path}'. Original: {len(full_content)} chars, Summary: {len(summary)} chars.")
+                notify(f"Summarized '{file_rel_path}'. Original: {len(full_content)} chars, Summary: {len(summary)} chars.")
                 logger.info(f"Content for {file_rel_path} summarized. Original length: {len(full_content)}, Summary length: {len(summary)}")
+                with self._summary_cache_lock:
+                    self._summary_cache[summary_cache_key] = summary
+                    while len(self._summary_cache) > SUMMARY_CACHE_MAX_ENTRIES:
+                        self._summary_cache.popitem(last=False)
                 return f"[Summarized Content of {file_rel_path}]:\n{summary}", True
             else:
-                self._display_error(f"Failed to summarize '{file_rel_path}'. Using truncated content. AI Error: {summary}")
+                notify(f"Failed to summarize '{file_rel_path}'. Using truncated content. AI Error: {summary}", is_error=True)
                 logger.warning(f"Summarization failed for {file_rel_path}. Fallback to truncation. Error: {summary}")
                 return full_content[:MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT], False
         elif len(full_content) > MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT:
             return full_content[:MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT], False
         return full_content, False
 
+    def _get_system_prompt_header(self, admin_enabled: bool) -> str:
+        # only admin mode varies between turns; the code folder is fixed for the session
+        cached_header = self._prompt_header_cache.get(admin_enabled)
+        if cached_header is not None:
+            return cached_header
+        admin_status_text: str = 'ENABLED (AI can propose file system changes and run commands if confirmed by user)' if admin_enabled else 'DISABLED (AI file system changes and command execution are off)'
+        system_prompt_header_text: str = textwrap.dedent(f"""
+            You are an AI assistant specialized in code generation, analysis, and modification for the project located at '{self.code_folder_path}'.
+            Admin Mode: {admin_status_text}.
+            When proposing changes to existing files or suggesting new files, use the following format precisely for each file:
+            # FILEPATH: path/relative/to/project_root/filename.ext
+            ```optional_language_marker
+            (full content of the file or code block)
+            ```
+            Ensure filepaths are relative to the project root: '{basename(self.code_folder_path)}/'.
+        """).strip()
+        self._prompt_header_cache[admin_enabled] = system_prompt_header_text
+        return system_prompt_header_text
+
+    def _start_pinned_file_summaries(self, executor: ThreadPoolExecutor) -> Dict[str, Tuple[str, "Future[Tuple[str, bool]]", List[Tuple[str, bool]]]]:
+        pending_summaries: Dict[str, Tuple[str, "Future[Tuple[str, bool]]", List[Tuple[str, bool]]]] = {}
+        # projected prompt chars of the files ahead; once they could fill the budget, later files are
+        # left to the prompt loop, which summarizes them on demand only if it actually reaches them
+        projected_chars = 0
+        for pinned_abs_path in self.active_files_pinned:
+            if projected_chars >= MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT:
+                break
+            pinned_rel_path = relpath(pinned_abs_path, self.project_indexer.base_path).replace('\\', '/')
+            file_info = self.project_indexer.file_index.get(pinned_rel_path)
+            if file_info is None:
+                continue
+            # size in bytes is an upper bound on length in chars, so small files are skipped without reading them
+            if file_info["size_bytes"] <= MIN_CHARS_TO_TRIGGER_SUMMARIZATION:
+                projected_chars += min(file_info["size_bytes"], MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT)
+                continue
+            projected_chars += MAX_INDEXED_FILE_CONTENT_CHARS_IN_PROMPT
+            file_content = self.project_indexer.get_file_content(pinned_rel_path)
+            if file_content and len(file_content) > MIN_CHARS_TO_TRIGGER_SUMMARIZATION:
+                summary_notices: List[Tuple[str, bool]] = []
+                summary_future = executor.submit(self._summarize_content_if_needed, pinned_rel_path, file_content, summary_notices)
+                pending_summaries[pinned_rel_path] = (file_content, summary_future, summary_notices)
+        return pending_summaries
+
     def _build_prompt_with_context(self, user_message: str) -> List[helper.GoogleGenAIContentType]:
         content_parts: List[helper.GoogleGenAIContentType] = []
         total_chars_from_files = 0
@@ -158,18 +296,7 @@ class ChatBot:
                 logger.error("Settings not available in _build_prompt_with_context.")
                 return [f"{Fore.RED}Error: Application settings are missing.{Style.RESET_ALL}"]
 
-            admin_status_text: str = 'ENABLED (AI can propose file system changes and run commands if confirmed by user)' if self.settings.get('admin_mode_enabled', False) else 'DISABLED (AI file system changes and command execution are off)'
-            system_prompt_header_text: str = textwrap.dedent(f"""
-                You are an AI assistant specialized in code generation, analysis, and modification for the project located at '{self.code_folder_path}'.
-                Admin Mode: {admin_status_text}.
-                When proposing changes to existing files or suggesting new files, use the following format precisely for each file:
-                # FILEPATH: path/relative/to/project_root/filename.ext
-                ```optional_language_marker
-                (full content of the file or code block)
-                ```
-                Ensure filepaths are relative to the project root: '{basename(self.code_folder_path)}/'.
-            """).strip()
-            content_parts.append(system_prompt_header_text)
+            content_parts.append(self._get_system_prompt_header(bool(self.settings.get('admin_mode_enabled', False))))
 
             project_tree_str = self.project_indexer.get_project_tree()
             system_prompt_context_text: str = f"\n\n--- Project Codebase Structure ({basename(self.code_folder_path)}/) ---\n{project_tree_str}\n--- End Project Codebase Structure ---"
@@ -178,49 +305,70 @@ class ChatBot:
             files_for_context_content: Dict[str, str] = {}
             files_for_context_log: List[str] = []
 
+            # summarization round-trips for large pinned files run concurrently; the loop below consumes them in order
+            summary_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SUMMARIES, thread_name_prefix='summarize')
+            try:
+                pending_summaries = self._start_pinned_file_summaries(summary_executor)
+            except Exception as e_prefetch:
+                logger.error(f"Error starting concurrent summarization of pinned files: {e_prefetch}", exc_info=True)
+                pending_summaries = {}
+
             temp_unpinnable_files = set()
-            for pinned_abs_path in self.active_files_pinned:
-                try:
-                    pinned_rel_path = relpath(pinned_abs_path, self.project_indexer.base_path).replace('\\', '/')
-                    if pinned_rel_path not in self.project_indexer.file_index:
-                        self._display_error(f"Pinned file '{basename(pinned_abs_path)}' no longer in index. Unpinning.")
-                        logger.warning(f"Pinned file {pinned_abs_path} not in index. Marking for unpin.")
-                        temp_unpinnable_files.add(pinned_abs_path)
-                        continue
+            try:
+                for pinned_abs_path in self.active_files_pinned:
+                    try:
+                        pinned_rel_path = relpath(pinned_abs_path, self.project_indexer.base_path).replace('\\', '/')
+                        if pinned_rel_path not in self.project_indexer.file_index:
+                            self._display_error(f"Pinned file '{basename(pinned_abs_path)}' no longer in index. Unpinning.")
+                            logger.warning(f"Pinned file {pinned_abs_path} not in index. Marking for unpin.")
+                            temp_unpinnable_files.add(pinned_abs_path)
+                            continue
+
+                        pending_summary = pending_summaries.get(pinned_rel_path)
+                        if pending_summary is not None:
+                            current_file_original_content, summary_future, summary_notices = pending_summary
+                            content_to_add, was_summarized = summary_future.result()
+                            for notice, is_error in summary_notices:
+                                if is_error:
+                                    self._display_error(notice)
+                                else:
+                                    self._display_system_message(notice)
+                        else:
+                            current_file_original_content = self.project_indexer.get_file_content(pinned_rel_path)
+                            if not current_file_original_content:
+                                files_for_context_log.append(f"{pinned_rel_path} (pinned, 0 chars or error reading)")
+                                if current_file_original_content is not None :
+                                     files_for_context_content[pinned_rel_path] = ""
+                                continue
+
+                            content_to_add, was_summarized = self._summarize_content_if_needed(pinned_rel_path, current_file_original_content)
+
+                        if total_chars_from_files + len(content_to_add) > MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT:
+                            chars_can_add = MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT - total_chars_from_files
+                            if chars_can_add <=0:
+                                logger.warning(f"Max total file content limit ({MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT} chars) reached. Cannot add more file content including '{pinned_rel_path}'.")
+                                self._display_system_message(f"Warning: Max total file content limit reached. Cannot include content from '{basename(pinned_abs_path)}' or subsequent files.")
+                                break
+                            content_to_add = content_to_add[:chars_can_add]
+                            log_suffix = " - heavily truncated due to total limit"
 
-                    current_file_original_content = self.project_indexer.get_file_content(pinned_rel_path)
-                    if not current_file_original_content:
-                        files_for_context_log.append(f"{pinned_rel_path} (pinned, 0 chars or error reading)")
-                        if current_file_original_content is not None :
-                             files_for_context_content[pinned_rel_path] = ""
-                        continue
+                        else:
+                            log_suffix = " - summarized" if was_summarized else (" - truncated" if len(content_to_add) < len(current_file_original_content) else "")
 
-                    content_to_add, was_summarized = self._summarize_content_if_needed(pinned_rel_path, current_file_original_content)
+                        files_for_context_content[pinned_rel_path] = content_to_add
+                        files_for_context_log.append(f"{pinned_rel_path} (pinned, {len(content_to_add)} chars){log_suffix}")
+                        total_chars_from_files += len(content_to_add)
 
-                    if total_chars_from_files + len(content_to_add) > MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT:
-                        chars_can_add = MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT - total_chars_from_files
-                        if chars_can_add <=0:
-                            logger.warning(f"Max total file content limit ({MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT} chars) reached. Cannot add more file content including '{pinned_rel_path}'.")
-                            self._display_system_message(f"Warning: Max total file content limit reached. Cannot include content from '{basename(pinned_abs_path)}' or subsequent files.")
+                        if total_chars_from_files >= MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT:
+                            logger.info(f"Max total file content limit ({MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT} chars) reached after adding '{pinned_rel_path}'.")
+                            self._display_system_message(f"Warning: Max total file content limit reached. Further pinned files may be skipped or truncated.")
                             break
-                        content_to_add = content_to_add[:chars_can_add]
-                        log_suffix = " - heavily truncated due to total limit"
 
-                    else:
-                        log_suffix = " - summarized" if was_summarized else (" - truncated" if len(content_to_add) < len(current_file_original_content) else "")
-
-                    files_for_context_content[pinned_rel_path] = content_to_add
-                    files_for_context_log.append(f"{pinned_rel_path} (pinned, {len(content_to_add)} chars){log_suffix}")
-                    total_chars_from_files += len(content_to_add)
-
-                    if total_chars_from_files >= MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT:
-                        logger.info(f"Max total file content limit ({MAX_TOTAL_FILE_CONTENT_CHARS_IN_PROMPT} chars) reached after adding '{pinned_rel_path}'.")
-                        self._display_system_message(f"Warning: Max total file content limit reached. Further pinned files may be skipped or truncated.")
-                        break
-
-                except Exception as e_pin_file:
-                    logger.error(f"Error processing pinned file {pinned_abs_path}: {e_pin_file}", exc_info=True)
-                    self._display_error(f"Error accessing pinned file '{basename(pinned_abs_path)}'.")
+                    except Exception as e_pin_file:
+                        logger.error(f"Error processing pinned file {pinned_abs_path}: {e_pin_file}", exc_info=True)
+                        self._display_error(f"Error accessing pinned file '{basename(pinned_abs_path)}'.")
+            finally:
+                summary_executor.shutdown(wait=True, cancel_futures=True)
             for unpin_path in temp_unpinnable_files: self.active_files_pinned.discard(unpin_path)
 
             context_blocks_text_list: List[str] = []
@@ -326,14 +474,20 @@ class ChatBot:
             if not new_content.strip() and not new_content_lines_for_diff:
                 new_content_lines_for_diff = ['\n'] if new_content == "" else []
 
-            with open(filepath_abs, 'r', encoding='utf-8', errors='replace') as f:
-                current_content_lines: List[str] = f.read().splitlines(keepends=True)
-
             try:
                 relative_display_path: str = relpath(filepath_abs, start=self.project_indexer.base_path).replace('\\', '/')
             except ValueError:
                 relative_display_path = basename(filepath_abs)
 
+            current_size_bytes = os.stat(filepath_abs).st_size
+            if current_size_bytes > MAX_DIFF_FILE_BYTES:
+                self._display_system_message(f"Diff for {relative_display_path} skipped: current file is too large to diff ({current_size_bytes / (1024*1024):.2f}MB).")
+                return True
+
+            with open(filepath_abs, 'rb', buffering=DIFF_READ_BUFFER_BYTES) as f:
+                current_content_text = f.read().decode('utf-8', errors='replace')
+            current_content_lines: List[str] = current_content_text.replace('\r\n', '\n').replace('\r', '\n').splitlines(keepends=True)
+
             diff = difflib.unified_diff(
                 current_content_lines,
                 new_content_lines_for_diff,
@@ -349,16 +503,20 @@ class ChatBot:
                     logger.info(f"No functional changes (content identical after normalization) for {relative_display_path}.")
                     return False
 
-            print(f"{Fore.BLUE}Diff for {relative_display_path}{Style.RESET_ALL}")
+            diff_output_lines: List[str] = [f"{Fore.BLUE}Diff for {relative_display_path}{Style.RESET_ALL}"]
+            append_line = diff_output_lines.append
             for line in diff_text.splitlines():
                 if line.startswith('+') and not line.startswith('+++'):
-                    print(f"{Fore.GREEN}{line}{Style.RESET_ALL}")
+                    append_line(f"{Fore.GREEN}{line}{Style.RESET_ALL}")
                 elif line.startswith('-') and not line.startswith('---'):
-                    print(f"{Fore.RED}{line}{Style.RESET_ALL}")
+                    append_line(f"{Fore.RED}{line}{Style.RESET_ALL}")
                 elif line.startswith('@@'):
-                    print(f"{Fore.CYAN}{line}{Style.RESET_ALL}")
+                    append_line(f"{Fore.CYAN}{line}{Style.RESET_ALL}")
                 else:
-                    print(line)
+                    append_line(line)
+            append_line("")
+            sys.stdout.write("\n".join(diff_output_lines))
+            sys.stdout.flush()
             return True
         except FileNotFoundError:
             self._display_error(f"Cannot display diff: Original file {basename(filepath_abs)} not found at {filepath_abs}.")
@@ -915,7 +1073,7 @@ class ChatBot:
                         rel_display_path = relpath(abs_pinned_path, self.project_indexer.base_path).replace('\\','/')
 
                         file_size_bytes = -1
-                        if exists(abs_pinned_path) and isfile(abs_pinned_path):
+                        if isfile(abs_pinned_path):
                             file_size_bytes = getsize(abs_pinned_path)
                             total_pinned_size_bytes += file_size_bytes
 
@@ -970,8 +1128,7 @@ class ChatBot:
 
             new_model_client_name = args[0].lower()
             if new_model_client_name in available_model_names:
-                self.settings['model_name'] = new_model_client_name
-                database.save_settings(self.conn, self.settings)
+                self._update_settings({'model_name': new_model_client_name})
                 self._display_system_message(f"AI model client set to: {Fore.GREEN}{new_model_client_name}{Style.RESET_ALL}")
                 logger.info(f"User changed AI model client to {new_model_client_name}")
             elif new_model_client_name in helper.SUPPORTED_MODELS:
@@ -1000,15 +1157,15 @@ class ChatBot:
                     value = self.settings.get(key)
                     display_value_str: str
                     if key == 'admin_mode_enabled':
-                        display_value_str = f"{Fore.GREEN}ON{Style.RESET_ALL}" if value else f"{Fore.RED}OFF{Style.RESET_ALL}"
+                        display_value_str = STATUS_ON_LABEL if value else STATUS_OFF_LABEL
                     elif key == 'test_command':
-                        display_value_str = f"'{value}'" if value else f"{Fore.DIM}Not set{Style.RESET_ALL}"
+                        display_value_str = f"'{value}'" if value else NOT_SET_LABEL
                     elif key == 'model_name':
-                        display_value_str = f"{Fore.GREEN}{value}{Style.RESET_ALL}" if value else f"{Fore.DIM}Not set{Style.RESET_ALL}"
+                        display_value_str = f"{Fore.GREEN}{value}{Style.RESET_ALL}" if value else NOT_SET_LABEL
                     elif isinstance(value, float):
                         display_value_str = f"{value:.2f}"
                     elif value is None:
-                        display_value_str = f"{Fore.DIM}Not set{Style.RESET_ALL}"
+                        display_value_str = NOT_SET_LABEL
                     else:
                         display_value_str = str(value)
                     print(f"  {key:<20}: {display_value_str}")
@@ -1025,7 +1182,6 @@ class ChatBot:
                     self._display_error(f"Unknown setting key: '{key_to_set}'. Valid keys are: {', '.join(display_order)}")
                     return
 
-                current_settings_copy = self.settings.copy()
                 new_value: Any = value_to_set_str
 
                 if key_to_set == "temperature":
@@ -1054,9 +1210,7 @@ class ChatBot:
                         return
                     new_value = value_to_set_str.lower()
 
-                current_settings_copy[key_to_set] = new_value
-                database.save_settings(self.conn, current_settings_copy)
-                self.settings = current_settings_copy
+                self._update_settings({key_to_set: new_value})
                 self._display_system_message(f"Setting '{key_to_set}' has been updated to '{new_value if new_value is not None else 'Not set'}'.")
 
             elif len(args) == 1 and args[0].lower() in display_order:
@@ -1115,13 +1269,12 @@ class ChatBot:
                 return
 
             if new_status == current_status and args:
-                self._display_system_message(f"Admin Mode is already {f'{Fore.GREEN}ON{Style.RESET_ALL}' if current_status else f'{Fore.RED}OFF{Style.RESET_ALL}'}. No change made.")
+                self._display_system_message(f"Admin Mode is already {STATUS_ON_LABEL if current_status else STATUS_OFF_LABEL}. No change made.")
                 return
 
-            self.settings['admin_mode_enabled'] = new_status
-            database.save_settings(self.conn, self.settings)
+            self._update_settings({'admin_mode_enabled': new_status})
 
-            final_status_text = f"{Fore.GREEN}ON{Style.RESET_ALL}" if new_status else f"{Fore.RED}OFF{Style.RESET_ALL}"
+            final_status_text = STATUS_ON_LABEL if new_status else STATUS_OFF_LABEL
             self._display_system_message(f"{action_msg_verb} Admin Mode to: {final_status_text}")
 
             if new_status:
@@ -1176,8 +1329,7 @@ class ChatBot:
                     fallback_model = available_models[0]
                     self._display_error(f"Currently selected AI model '{model_name}' is unavailable. Switching to the first available model: '{fallback_model}'.")
                     logger.warning(f"Model '{model_name}' was unavailable. Falling back to '{fallback_model}'.")
-                    self.settings['model_name'] = fallback_model
-                    database.save_settings(self.conn, self.settings)
+                    self._update_settings({'model_name': fallback_model})
                     model_name = fallback_model
                 else:
                     self._display_error("FATAL: No AI models are currently available or initialized. Please check API key configurations and application logs.")
@@ -1213,35 +1365,14 @@ class ChatBot:
 
     def _handle_command(self, user_input: str) -> bool:
         try:
-            parts: List[str] = user_input.strip().split()
+            parts: List[str] = user_input.split(None, 1)
             if not parts:
                 return True
 
             command: str = parts[0].lower()
-            args: List[str] = parts[1:]
-
-            command_mapping: Dict[str, Any] = {
-                "/help": self._handle_help_command,
-                "/quit": lambda a: False,
-                "/exit": lambda a: False,
-                "/clear": self._handle_clear_command,
-                "/add": self._handle_add_command,
-                "/drop": self._handle_drop_command,
-                "/list": self._handle_list_command,
-                "/apply": self._review_and_apply_changes,
-                "/discard": self._handle_discard_command,
-                "/model": self._handle_model_command,
-                "/settings": self._handle_settings_command,
-                "/codefolder": self._handle_codefolder_command,
-                "/sudo": self._handle_admin_command,
-                "/runtest": self._handle_runtest_command,
-                "/reindex": self._handle_reindex_command,
-                "/find": self._handle_find_command,
-            }
-            if stream:
-                command_mapping["/capture_context"] = self._handle_capture_context_command
-
-            handler = command_mapping.get(command)
+            args: List[str] = parts[1].split() if len(parts) > 1 else []
+
+            handler = self._command_handlers.get(command)
             if handler:
                 result = handler(args)
                 return result if isinstance(result, bool) else True
@@ -1255,6 +1386,7 @@ class ChatBot:
 
     def _setup_voice_input(self):
         try:
+            from voice import VoiceCommandHandler
             self.voice_handler = VoiceCommandHandler()
             logger.info("VoiceCommandHandler initialized successfully.")
         except ImportError:
@@ -1264,7 +1396,27 @@ class ChatBot:
             logger.error(f"Failed to initialize VoiceCommandHandler: {e}. Voice commands disabled.", exc_info=True)
             self.voice_handler = None
 
+    def _voice_input_ready(self) -> bool:
+        return self.voice_handler is not None or (self._voice_supported and not self._voice_init_attempted)
+
     def _on_voice_hotkey_pressed(self):
+        if self.voice_handler is None and self._voice_supported and not self._voice_init_attempted:
+            self._voice_init_attempted = True
+            self._display_system_message("\rInitializing voice input (calibrating microphone)...")
+            # calibration blocks for about a second; keep it off the keyboard hook thread
+            self._voice_processing_thread = threading.Thread(target=self._init_voice_and_listen, name="voice-init", daemon=True)
+            self._voice_processing_thread.start()
+            return
+        if self.voice_handler is None and self._voice_processing_thread is not None and self._voice_processing_thread.is_alive():
+            self._display_system_message("\r(Voice input is still initializing...)")
+            return
+        self._listen_for_voice_command()
+
+    def _init_voice_and_listen(self):
+        self._setup_voice_input()
+        self._listen_for_voice_command()
+
+    def _listen_for_voice_command(self):
         if not self.voice_handler:
             msg = "\r(Voice system not active) "
             try:
@@ -1279,16 +1431,24 @@ class ChatBot:
             sys.stdout.write('\r(Listening for voice command...)' + ' ' * (os.get_terminal_size().columns - 30) + '\n')
             sys.stdout.flush()
 
-            transcribed_text = self.voice_handler.listen_and_transcribe()
+            # recognition runs on the handler's worker, so the hotkey thread is free as soon as capture ends
+            if not self.voice_handler.listen_in_background(self._on_voice_transcribed):
+                self._display_prompt()
+
+        except Exception as e:
+            logger.error(f"Error during voice transcription or hotkey handling: {e}", exc_info=True)
+            self._display_error(f"Voice input error: {e}")
+            self._display_prompt()
 
+    def _on_voice_transcribed(self, transcribed_text: Optional[str]):
+        try:
             if transcribed_text:
                 self._display_system_message(f"Voice transcribed: '{transcribed_text}' Processing...")
                 self._process_input_as_if_typed(transcribed_text)
             else:
                 self._display_prompt()
-
         except Exception as e:
-            logger.error(f"Error during voice transcription or hotkey handling: {e}", exc_info=True)
+            logger.error(f"Error while processing transcribed voice input: {e}", exc_info=True)
             self._display_error(f"Voice input error: {e}")
             self._display_prompt()
 
@@ -1313,8 +1473,8 @@ class ChatBot:
         if not keyboard:
             logger.warning("Keyboard module not available. Global hotkeys disabled.")
             return
-        if not self.voice_handler:
-             logger.info("Voice input system not configured/failed to init, skipping hotkey setup.")
+        if not self._voice_input_ready():
+             logger.info("Voice input system not available (e.g., SpeechRecognition missing), skipping hotkey setup.")
              return
 
         try:
@@ -1331,18 +1491,24 @@ class ChatBot:
 
     def _handle_capture_context_command(self, args: List[str]) -> None:
         try:
-            if not stream:
+            try:
+                import stream
+            except ImportError as e_import:
+                logger.error(f"Failed to import screen capture module: {e_import}", exc_info=True)
                 self._display_error("Screen capture module (stream.py) not available or failed to import.")
                 return
 
             user_text_prompt = " ".join(args) if args else "Analyze this screenshot, focusing on any visible code, UI elements, or error messages."
             self._display_system_message("Capturing screen...")
 
+            if self._screen_grabber is None:
+                self._screen_grabber = stream.ScreenGrabber()
+            grabber = self._screen_grabber
+
             result_container = {"image_data": None, "error": None}
 
             def capture_task_sync_wrapper():
                 try:
-                    grabber = stream.ScreenGrabber()
                     image_dict = asyncio.run(grabber.capture_screen_base64_async(output_format="JPEG"))
 
                     if image_dict and "data" in image_dict and "mime_type" in image_dict:
@@ -1410,19 +1576,22 @@ class ChatBot:
 
     def _print_startup_info(self, show_full_logo: bool = True):
         try:
-            os.system('cls' if os.name == 'nt' else 'clear')
+            # the whole banner is assembled first and written with a single call
+            out: List[str] = [CLEAR_SCREEN_SEQUENCE]
 
             num_indexed_files_str = "N/A"
             if hasattr(self, 'project_indexer') and self.project_indexer and self.project_indexer.file_index is not None:
                 num_indexed_files_str = str(len(self.project_indexer.file_index))
 
             if show_full_logo:
-                print(f"\n\n\t\t\t\t\t\t\t      [{Fore.YELLOW}{num_indexed_files_str}{Style.RESET_ALL}] Files Indexed\n ")
+                out.append(f"\n\n\t\t\t\t\t\t\t      [{Fore.YELLOW}{num_indexed_files_str}{Style.RESET_ALL}] Files Indexed\n \n")
 
-            print(f"\n\t\t\t\t     Type '{Fore.YELLOW}/help{Style.RESET_ALL}' for commands, '{Fore.YELLOW}/exit{Style.RESET_ALL}' to quit\n")
+            out.append(f"\n\t\t\t\t     Type '{Fore.YELLOW}/help{Style.RESET_ALL}' for commands, '{Fore.YELLOW}/exit{Style.RESET_ALL}' to quit\n\n")
 
             if not self.settings:
-                print(f"{Fore.RED}{Style.BRIGHT}Error: Settings not loaded. Startup information may be incomplete.{Style.RESET_ALL}\n")
+                out.append(f"{Fore.RED}{Style.BRIGHT}Error: Settings not loaded. Startup information may be incomplete.{Style.RESET_ALL}\n\n")
+                sys.stdout.write("".join(out))
+                sys.stdout.flush()
                 return
 
             current_model_client: str = self.settings.get('model_name', 'N/A')
@@ -1431,94 +1600,82 @@ class ChatBot:
             except ValueError:
                 relative_code_folder = self.code_folder_path
 
-            print(f"\n\t\t\t\t\t\t\t       AI Model: {Fore.YELLOW}{current_model_client}{Style.RESET_ALL}\n"
-                  f"\n\n\t\t\t\t\t\t\t   Enviorment: {Fore.YELLOW}{relative_code_folder}{Style.RESET_ALL} [{Fore.YELLOW}{num_indexed_files_str}{Style.RESET_ALL}]\n")
-
-            if 'keyboard' in sys.modules or keyboard:
-                if self.voice_handler and self.hotkeys_active:
-                    self._display_system_message(f"\n\t\t\t\t\t\t\t   {Style.RESET_ALL}Listen: {Fore.YELLOW}Ctrl+Shift+V{Style.RESET_ALL}\n\n")
-                elif self.voice_handler and not self.hotkeys_active:
-                    self._display_error(f"Voice input hotkey {Fore.CYAN}Ctrl+Shift+V{Style.RESET_ALL} FAILED to activate (check logs/permissions). Voice input via hotkey is disabled.\n\n")
-                elif not self.voice_handler:
-                    self._display_system_message(f"Voice input system could not be initialized (e.g., missing SpeechRecognition). Hotkey {Fore.CYAN}Ctrl+Shift+V{Style.RESET_ALL} is disabled.\n\n")
+            out.append(f"\n\t\t\t\t\t\t\t       AI Model: {Fore.YELLOW}{current_model_client}{Style.RESET_ALL}\n"
+                       f"\n\n\t\t\t\t\t\t\t   Enviorment: {Fore.YELLOW}{relative_code_folder}{Style.RESET_ALL} [{Fore.YELLOW}{num_indexed_files_str}{Style.RESET_ALL}]\n\n")
+
+            if keyboard:
+                voice_ready = self._voice_input_ready()
+                if voice_ready and self.hotkeys_active:
+                    out.append(f"{Fore.YELLOW}\n\t\t\t\t\t\t\t   {Style.RESET_ALL}Listen: {Fore.YELLOW}Ctrl+Shift+V{Style.RESET_ALL}\n\n{Style.RESET_ALL}\n")
+                elif voice_ready and not self.hotkeys_active:
+                    out.append(f"{Fore.RED}{Style.BRIGHT}Error: Voice input hotkey {Fore.CYAN}Ctrl+Shift+V{Style.RESET_ALL} FAILED to activate (check logs/permissions). Voice input via hotkey is disabled.\n\n{Style.RESET_ALL}\n")
+                elif not voice_ready:
+                    out.append(f"{Fore.YELLOW}Voice input system could not be initialized (e.g., missing SpeechRecognition). Hotkey {Fore.CYAN}Ctrl+Shift+V{Style.RESET_ALL} is disabled.\n\n{Style.RESET_ALL}\n")
             else:
-                self._display_system_message(f"Keyboard module not available or failed to import. Hotkeys (including for voice input) are disabled.\n\n")
+                out.append(f"{Fore.YELLOW}Keyboard module not available or failed to import. Hotkeys (including for voice input) are disabled.\n\n{Style.RESET_ALL}\n")
 
-            print("") # Final empty line for spacing
+            out.append("\n") # Final empty line for spacing
+            sys.stdout.write("".join(out))
+            sys.stdout.flush()
 
         except Exception as e:
             logger.error(f"Error printing startup info: {e}", exc_info=True)
             print(f"{Fore.RED}{Style.BRIGHT}Error displaying critical startup information.{Style.RESET_ALL}")
 
-    def _handle_help_command(self, args: List[str]) -> None:
-        if not self.command_list:
-            print(f"  {Style.DIM}No commands available.{Style.RESET_ALL}")
-            return
-
+    def _build_help_pages(self, items_per_page: int = 5) -> List[str]:
         sorted_commands = sorted(self.command_list.items())
-        num_commands = len(sorted_commands)
-        items_per_page = 5
-        num_pages = (num_commands + items_per_page - 1) // items_per_page
-        
-        if num_pages == 0:
-            num_pages = 1
+        num_pages = max(1, (len(sorted_commands) + items_per_page - 1) // items_per_page)
+        command_col_width = max((len(cmd) for cmd, _ in sorted_commands), default=0)
+        usage_marker = "Usage: "
+        usage_indent_spaces = " " * (2 + command_col_width + 3)
 
-        current_page = 1
-
-        max_cmd_len = 0
-        if sorted_commands:
-            for cmd, _ in sorted_commands:
-                if len(cmd) > max_cmd_len:
-                    max_cmd_len = len(cmd)
-        command_col_width = max_cmd_len
+        pages: List[str] = []
+        for page_number in range(1, num_pages + 1):
+            page_lines: List[str] = [f"{Fore.YELLOW}\n {Fore.RESET}Commands Page [{Fore.GREEN}{page_number}{Fore.RESET} / {Fore.GREEN}{num_pages}{Fore.RESET}]:\n{Style.RESET_ALL}"]
 
-        while True:
-            os.system('cls' if os.name == 'nt' else 'clear') 
-            
-            self._display_system_message(f"\n {Fore.RESET}Commands Page [{Fore.GREEN}{current_page}{Fore.RESET} / {Fore.GREEN}{num_pages}{Fore.RESET}]:\n")
-
-            start_index = (current_page - 1) * items_per_page
-            end_index = start_index + items_per_page
-            current_page_commands = sorted_commands[start_index:end_index]
-
-            for command, full_description in current_page_commands:
+            start_index = (page_number - 1) * items_per_page
+            for command, full_description in sorted_commands[start_index:start_index + items_per_page]:
                 usage_part = ""
                 description_part = full_description
-                
-                usage_marker = "Usage: "
-                usage_idx = full_description.find(usage_marker)
 
+                usage_idx = full_description.find(usage_marker)
                 if usage_idx > 0:
                     description_part = full_description[:usage_idx].strip()
                     usage_part = full_description[usage_idx:].strip()
-                elif full_description.startswith(usage_marker): 
+                elif full_description.startswith(usage_marker):
                     description_part = ""
                     usage_part = full_description.strip()
 
                 cmd_formatted = f"{Fore.GREEN}{command:<{command_col_width}}{Style.RESET_ALL}"
-                
-                if description_part:
-                    print(f"  {cmd_formatted} : {description_part}")
-                else:
-                    print(f"  {cmd_formatted} :")
-
+                page_lines.append(f"  {cmd_formatted} : {description_part}" if description_part else f"  {cmd_formatted} :")
                 if usage_part:
-                    usage_indent_spaces = " " * (2 + command_col_width + 3)
-                    print(f"{usage_indent_spaces}{Style.DIM}{usage_part}{Style.RESET_ALL}")
+                    page_lines.append(f"{usage_indent_spaces}{Style.DIM}{usage_part}{Style.RESET_ALL}")
 
             nav_options = []
-            if current_page > 1:
+            if page_number > 1:
                 nav_options.append(f"[{Fore.GREEN}P{Style.RESET_ALL}] Previous")
-            if current_page < num_pages:
+            if page_number < num_pages:
                 nav_options.append(f"[{Fore.GREEN}N{Style.RESET_ALL}] Next")
             nav_options.append(f"[{Fore.GREEN}B{Style.RESET_ALL}] Back")
-            
-            if not nav_options:
-                 nav_options.append(f"[{Fore.GREEN}Q{Style.RESET_ALL}] Quit")
+            page_lines.append("\n" + "\n".join(nav_options))
 
+            pages.append("\n".join(page_lines))
+        return pages
+
+    def _handle_help_command(self, args: List[str]) -> None:
+        if not self.command_list:
+            print(f"  {Style.DIM}No commands available.{Style.RESET_ALL}")
+            return
+
+        if self._help_pages is None:
+            self._help_pages = self._build_help_pages()
+        num_pages = len(self._help_pages)
+        current_page = 1
+
+        while True:
+            sys.stdout.write(f"{CLEAR_SCREEN_SEQUENCE}{self._help_pages[current_page - 1]}\n")
+            sys.stdout.flush()
 
-            print("\n" + "\n".join(nav_options))
-            
             try:
                 choice = input("\n//: ").lower().strip()
             except EOFError:
@@ -1539,7 +1696,6 @@ class ChatBot:
                     print(f"{Fore.RED}Already on the first page.{Style.RESET_ALL}")
                     time.sleep(1)
             elif choice == 'q':
-                os.system('cls' if os.name == 'nt' else 'clear')
                 if hasattr(self, '_print_startup_info'):
                     self._print_startup_info(show_full_logo=False)
                 break
@@ -1548,7 +1704,6 @@ class ChatBot:
                 time.sleep(1.5)
 
     def _handle_clear_command(self, args: List[str]) -> None:
-        os.system('cls' if os.name == 'nt' else 'clear')
         self._print_startup_info(show_full_logo=False)
 
     def start(self) -> None:
@@ -1566,8 +1721,7 @@ class ChatBot:
                     fallback_model = available_models[0]
                     self._display_system_message(f"Warning: Initially selected AI model '{current_model_client}' is unavailable. Switching to '{fallback_model}'.")
                     logger.warning(f"Startup: Model '{current_model_client}' unavailable. Falling back to '{fallback_model}'.")
-                    self.settings['model_name'] = fallback_model
-                    database.save_settings(self.conn, self.settings)
+                    self._update_settings({'model_name': fallback_model})
                 else:
                     logger.critical("Startup: No AI models are available. Application functionality will be severely limited or non-functional.")
                     self._display_error("FATAL: No AI models are available. Please check API key configurations and application logs. Exiting.")
@@ -1613,6 +1767,23 @@ class ChatBot:
                 except Exception as e_hotkey_remove:
                     logger.error(f"Error during unregistration of hotkeys: {e_hotkey_remove}", exc_info=True)
 
+            if self.voice_handler is not None:
+                try:
+                    self.voice_handler.close()
+                except Exception as e_voice_close:
+                    logger.error(f"Error stopping the voice recognizer worker: {e_voice_close}", exc_info=True)
+
+            try:
+                self._flush_settings()
+            except Exception as e_settings_flush:
+                logger.error(f"Error saving pending settings on exit: {e_settings_flush}", exc_info=True)
+
+            if self._screen_grabber is not None:
+                try:
+                    self._screen_grabber.close()
+                except Exception as e_grabber_close:
+                    logger.error(f"Error closing screen grabber: {e_grabber_close}", exc_info=True)
+
             if self.conn:
                 try:
                     self.conn.close()
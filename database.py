@@ -1,5 +1,6 @@
 import os, sys, logging, sqlite3
-from typing import Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -7,9 +8,35 @@ DEFAULT_TEST_COMMAND: Optional[str] = None
 
 DbConnection = sqlite3.Connection
 
-class ConnectionError(Exception):
+_SETTINGS_COLUMNS: Tuple[str, ...] = ("model_name", "temperature", "admin_mode_enabled", "test_command")
+_SETTINGS_SQL: str = (
+    f"INSERT OR REPLACE INTO settings (id, {', '.join(_SETTINGS_COLUMNS)}) "
+    f"VALUES (?, {', '.join('?' * len(_SETTINGS_COLUMNS))})"
+)
+_CONNECTION_PRAGMAS: Tuple[str, ...] = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+class DatabaseConnectionError(Exception):
     pass
 
+@contextmanager
+def _write_txn(conn: DbConnection) -> Iterator[DbConnection]:
+    # connections run in autocommit mode; writes take the lock up front
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        # a failed COMMIT (e.g. 'database is locked') leaves the transaction open
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
 def connect(db_path: str) -> DbConnection:
     conn: Optional[DbConnection] = None
     try:
@@ -17,73 +44,71 @@ def connect(db_path: str) -> DbConnection:
         if db_dir:
             os.makedirs(db_dir, exist_ok=True)
 
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        logger.debug(f"Attempting schema update/creation for database: {db_path}")
+        conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        logger.debug("Attempting schema update/creation for database: %s", db_path)
         _create_or_update_tables(conn)
-        logger.info(f"Successfully connected to database: {db_path}")
+        logger.info("Successfully connected to database: %s", db_path)
         return conn
     except sqlite3.Error as e:
-        logger.error(f"Database connection error at {db_path}: {e}", exc_info=True)
+        logger.error("Database connection error at %s: %s", db_path, e, exc_info=True)
         if conn:
             conn.close()
-        raise ConnectionError(f"Database connection failed at {db_path}: {e}") from e
+        raise DatabaseConnectionError(f"Database connection failed at {db_path}: {e}") from e
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during DB connection or setup at {db_path}: {e}")
+        logger.exception("An unexpected error occurred during DB connection or setup at %s: %s", db_path, e)
         if conn:
             conn.close()
-        raise ConnectionError(f"Database initialization failed at {db_path}: {e}") from e
+        raise DatabaseConnectionError(f"Database initialization failed at {db_path}: {e}") from e
 
 def _create_or_update_tables(conn: DbConnection) -> None:
     try:
-        cursor = conn.cursor()
+        with _write_txn(conn):
+            cursor = conn.cursor()
+
+            settings_columns_sql = """
+                id INTEGER PRIMARY KEY,
+                model_name TEXT,
+                temperature REAL,
+                admin_mode_enabled INTEGER,
+                test_command TEXT
+            """
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS settings ({settings_columns_sql})')
+
+            cursor.execute("PRAGMA table_info(settings)")
+            existing_columns: List[str] = [column[1] for column in cursor.fetchall()]
+
+            required_columns: Dict[str, str] = {
+                 "model_name": "TEXT", "temperature": "REAL",
+                 "admin_mode_enabled": "INTEGER",
+                 "test_command": "TEXT"
+            }
+
+            if 'chat_mode' in existing_columns:
+                logger.info("Schema update: 'chat_mode' column is deprecated and will be ignored if present.")
 
-        settings_columns_sql = """
-            id INTEGER PRIMARY KEY,
-            model_name TEXT,
-            temperature REAL,
-            admin_mode_enabled INTEGER,
-            test_command TEXT
-        """
-        cursor.execute(f'CREATE TABLE IF NOT EXISTS settings ({settings_columns_sql})')
-        conn.commit()
-
-        cursor.execute("PRAGMA table_info(settings)")
-        existing_columns: List[str] = [column[1] for column in cursor.fetchall()]
-
-        required_columns: Dict[str, str] = {
-             "model_name": "TEXT", "temperature": "REAL",
-             "admin_mode_enabled": "INTEGER",
-             "test_command": "TEXT"
-        }
-
-        if 'chat_mode' in existing_columns:
-            logger.info("Schema update: 'chat_mode' column is deprecated and will be ignored if present.")
-
-        for col_name, col_type in required_columns.items():
-            if col_name not in existing_columns:
-                logger.info(f"Adding missing column '{col_name}' to 'settings' table.")
-                cursor.execute(f'ALTER TABLE settings ADD COLUMN {col_name} {col_type}')
-
-                default_value: Any = None
-                if col_name == 'admin_mode_enabled': default_value = 0
-                elif col_name == 'test_command': default_value = DEFAULT_TEST_COMMAND
-
-                if default_value is not None:
-                     cursor.execute("INSERT OR IGNORE INTO settings (id) VALUES (1)")
-                     cursor.execute(f"UPDATE settings SET {col_name} = ? WHERE id = 1 AND {col_name} IS NULL", (default_value,))
-                conn.commit()
-        
-        cursor.execute("DROP TABLE IF EXISTS memories")
-        conn.commit()
+            for col_name, col_type in required_columns.items():
+                if col_name not in existing_columns:
+                    logger.info("Adding missing column '%s' to 'settings' table.", col_name)
+                    cursor.execute(f'ALTER TABLE settings ADD COLUMN {col_name} {col_type}')
+
+                    default_value: Any = None
+                    if col_name == 'admin_mode_enabled': default_value = 0
+                    elif col_name == 'test_command': default_value = DEFAULT_TEST_COMMAND
+
+                    if default_value is not None:
+                         cursor.execute("INSERT OR IGNORE INTO settings (id) VALUES (1)")
+                         cursor.execute(f"UPDATE settings SET {col_name} = ? WHERE id = 1 AND {col_name} IS NULL", (default_value,))
+
+            cursor.execute("DROP TABLE IF EXISTS memories")
         logger.debug("Database schema verified/updated successfully.")
 
     except sqlite3.Error as e:
-        logger.error(f"Database error during schema update: {e}", exc_info=True)
-        conn.rollback()
+        logger.error("Database error during schema update: %s", e, exc_info=True)
         raise
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during schema update: {e}")
-        conn.rollback()
+        logger.exception("An unexpected error occurred during schema update: %s", e)
         raise
 
 def load_settings(conn: DbConnection, default_admin_mode_env_str: Optional[str]) -> Optional[Dict[str, Any]]:
@@ -103,7 +128,7 @@ def load_settings(conn: DbConnection, default_admin_mode_env_str: Optional[str])
                 try:
                     default_admin_mode = bool(int(default_admin_mode_env_str))
                 except ValueError:
-                    logger.warning(f"Invalid string value for DEFAULT_ADMIN_MODE_ENV ('{default_admin_mode_env_str}'). Defaulting admin mode to False.")
+                    logger.warning("Invalid string value for DEFAULT_ADMIN_MODE_ENV ('%s'). Defaulting admin mode to False.", default_admin_mode_env_str)
 
         if row:
             col_names: List[str] = [col.strip() for col in cols_to_select.split(',')]
@@ -115,7 +140,7 @@ def load_settings(conn: DbConnection, default_admin_mode_env_str: Optional[str])
                 try:
                     admin_mode_setting = bool(int(db_admin_value))
                 except (ValueError, TypeError):
-                    logger.warning(f"Invalid value '{db_admin_value}' for admin_mode_enabled in DB. Using startup default.")
+                    logger.warning("Invalid value '%s' for admin_mode_enabled in DB. Using startup default.", db_admin_value)
             else:
                 admin_mode_setting = default_admin_mode
 
@@ -149,54 +174,42 @@ def load_settings(conn: DbConnection, default_admin_mode_env_str: Optional[str])
             
             values_tuple: Tuple = (1,) + tuple(values_list)
 
-            cursor.execute(f'INSERT INTO settings (id, {cols}) VALUES (?, {placeholders})', values_tuple)
-            conn.commit()
+            with _write_txn(conn):
+                cursor.execute(f'INSERT INTO settings (id, {cols}) VALUES (?, {placeholders})', values_tuple)
             logger.info("Default settings inserted.")
             return default_settings_dict.copy()
 
     except sqlite3.Error as e:
-        logger.error(f"Database error during settings load: {e}", exc_info=True)
+        logger.error("Database error during settings load: %s", e, exc_info=True)
         return None
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during settings load: {e}")
+        logger.exception("An unexpected error occurred during settings load: %s", e)
         return None
 
 def save_settings(conn: DbConnection, settings: Dict[str, Any]) -> None:
     try:
-        cursor = conn.cursor()
-
         admin_mode: bool = bool(settings.get("admin_mode_enabled", False))
         test_cmd: Optional[str] = settings.get("test_command", DEFAULT_TEST_COMMAND)
 
         if isinstance(test_cmd, str) and not test_cmd.strip():
              test_cmd = None 
 
-        cols_to_save: List[str] = [
-             "model_name", "temperature",
-             "admin_mode_enabled", "test_command"
-        ]
-        values_to_save: List[Any] = [
+        values_tuple: Tuple = (
+             1,
              settings.get("model_name", "gemini"),
              settings.get("temperature", 0.25),
              int(admin_mode),
              test_cmd
-        ]
-
-        cols_sql: str = ', '.join(cols_to_save)
-        placeholders_sql: str = ', '.join('?' * len(cols_to_save))
-        sql: str = f'INSERT OR REPLACE INTO settings (id, {cols_sql}) VALUES (?, {placeholders_sql})'
-        values_tuple: Tuple = (1,) + tuple(values_to_save)
+        )
 
-        cursor.execute(sql, values_tuple)
-        conn.commit()
+        with _write_txn(conn):
+            conn.execute(_SETTINGS_SQL, values_tuple)
         logger.info("Settings saved successfully.")
 
     except sqlite3.Error as e:
-        logger.error(f"Database error during settings save: {e}", exc_info=True)
-        conn.rollback()
+        logger.error("Database error during settings save: %s", e, exc_info=True)
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during settings save: {e}")
-        conn.rollback()
+        logger.exception("An unexpected error occurred during settings save: %s", e)
 
 if __name__ == '__main__':
     _TEST_DIR = os.path.join(os.path.dirname(__file__), 'files')
@@ -212,14 +225,14 @@ if __name__ == '__main__':
          )
     test_logger = logging.getLogger(__name__)
 
-    test_logger.info(f"Running database.py standalone test. DB: {_TEST_DB_PATH}")
+    test_logger.info("Running database.py standalone test. DB: %s", _TEST_DB_PATH)
 
     if os.path.exists(_TEST_DB_PATH):
-        test_logger.info(f"Removing existing test database: {_TEST_DB_PATH}")
+        test_logger.info("Removing existing test database: %s", _TEST_DB_PATH)
         try:
             os.remove(_TEST_DB_PATH)
         except OSError as e:
-             test_logger.error(f"Failed to remove old test DB: {e}. Proceeding anyway.")
+             test_logger.error("Failed to remove old test DB: %s. Proceeding anyway.", e)
 
     conn_test: Optional[DbConnection] = None
     try:
@@ -229,19 +242,19 @@ if __name__ == '__main__':
         test_logger.info("--- Testing Settings ---")
         settings = load_settings(conn_test, default_admin_mode_env_str="false")
         assert settings is not None, "load_settings should return defaults, not None"
-        test_logger.debug(f"Initial settings (defaults): {settings}")
+        test_logger.debug("Initial settings (defaults): %s", settings)
         assert 'chat_mode' not in settings, "'chat_mode' should not be in settings"
         assert settings['admin_mode_enabled'] is False, "Default admin_mode_enabled should be False"
 
         settings['temperature'] = 0.88
         settings['test_command'] = 'pytest --verbose'
         settings['admin_mode_enabled'] = True
-        test_logger.debug(f"Saving modified settings: {settings}")
+        test_logger.debug("Saving modified settings: %s", settings)
         save_settings(conn_test, settings)
 
         reloaded = load_settings(conn_test, default_admin_mode_env_str="false")
         assert reloaded is not None, "reload_settings should succeed"
-        test_logger.debug(f"Reloaded settings: {reloaded}")
+        test_logger.debug("Reloaded settings: %s", reloaded)
         assert reloaded['temperature'] == 0.88, "Temperature mismatch after reload"
         assert 'chat_mode' not in reloaded, "'chat_mode' should not be in reloaded settings"
         assert reloaded['admin_mode_enabled'] is True, "Admin mode mismatch after reload"
@@ -252,7 +265,7 @@ if __name__ == '__main__':
         test_logger.info("Standalone test completed successfully.")
 
     except Exception as e:
-         test_logger.exception(f"Standalone test FAILED: {e}")
+         test_logger.exception("Standalone test FAILED: %s", e)
          raise
     finally:
         if conn_test:
@@ -260,4 +273,4 @@ if __name__ == '__main__':
                 conn_test.close()
                 test_logger.info("Test database connection closed.")
             except sqlite3.Error as e:
-                 test_logger.error(f"Error closing test DB connection: {e}")
+                 test_logger.error("Error closing test DB connection: %s", e)
@@ -1,8 +1,9 @@
-import os, base64, logging
-from typing import Optional, Dict, Any, List, Union
-from google import genai
-from google.genai import types as google_genai_types
-from mistralai import Mistral
+import os, atexit, base64, logging, importlib.util
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Any, List, Union
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types as google_genai_types
 
 logger = logging.getLogger(__name__)
 
@@ -15,20 +16,47 @@ CODE_AGENT: Optional[str] = os.getenv(CODE_AGENT_ENV_VAR)
 DEFAULT_GEMINI_MODEL = "gemini-1.5-flash-latest"
 DEFAULT_MISTRAL_MODEL = "mistral-large-latest"
 DEFAULT_CODESTRAL_MODEL = "codestral-latest"
+HTTP_TIMEOUT_SECONDS = 120.0
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
 
-gemini_client_instance: Optional[genai.Client] = None
+gemini_client_instance: Optional["genai.Client"] = None
 mistral_client: Optional[Any] = None
 codestral_client: Optional[Any] = None
+_shared_http_client: Optional[Any] = None
 
 SUPPORTED_MODELS: Dict[str, Dict[str, Any]] = {}
 
+def _get_shared_http_client() -> Optional[Any]:
+    # one keep-alive pool (HTTP/2 when 'h2' is installed) for every Mistral/Codestral client
+    global _shared_http_client
+    if _shared_http_client is None:
+        try:
+            import httpx
+        except ImportError:
+            logger.debug("httpx not available; Mistral clients will use their own transports.")
+            return None
+        use_http2 = importlib.util.find_spec("h2") is not None
+        _shared_http_client = httpx.Client(
+            http2=use_http2,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS),
+        )
+        atexit.register(_shared_http_client.close)
+        logger.debug(f"Shared HTTP client created (http2={use_http2}).")
+    return _shared_http_client
+
 def init_api_clients(
     gemini_key: Optional[str] = None,
     mistral_key: Optional[str] = None,
-    codestral_key: Optional[str] = None
+    codestral_key: Optional[str] = None,
+    code_agent_id: Optional[str] = None,
+    architect_agent_id: Optional[str] = None
 ) -> None:
-    global gemini_client_instance, mistral_client, codestral_client, SUPPORTED_MODELS
+    global gemini_client_instance, mistral_client, codestral_client, SUPPORTED_MODELS, CODE_AGENT, ARCH_AGENT
 
+    # the import-time values predate .env loading in main, so re-resolve them here
+    CODE_AGENT = code_agent_id or os.getenv(CODE_AGENT_ENV_VAR)
+    ARCH_AGENT = architect_agent_id or os.getenv(ARCH_AGENT_ENV_VAR)
     gemini_client_instance = None
     mistral_client = None
     codestral_client = None
@@ -36,6 +64,7 @@ def init_api_clients(
 
     if gemini_key:
         try:
+            from google import genai
             if not os.getenv('GOOGLE_API_KEY'):
                 if gemini_key:
                     logger.info("GOOGLE_API_KEY not set in environment, attempting to use provided gemini_key for this session.")
@@ -49,7 +78,8 @@ def init_api_clients(
             SUPPORTED_MODELS["gemini"] = {
                 "client": gemini_client_instance,
                 "type": "gemini_client_models",
-                "name": DEFAULT_GEMINI_MODEL
+                "name": DEFAULT_GEMINI_MODEL,
+                "api_model": DEFAULT_GEMINI_MODEL if DEFAULT_GEMINI_MODEL.startswith("models/") else f"models/{DEFAULT_GEMINI_MODEL}",
             }
         except AttributeError as ae:
             logger.error(f"Failed Gemini client init (AttributeError): {ae}. "
@@ -67,9 +97,18 @@ def init_api_clients(
 
     if mistral_key:
         try:
-            mistral_client = Mistral(api_key=mistral_key)
+            from mistralai import Mistral
+            mistral_client = Mistral(api_key=mistral_key, client=_get_shared_http_client())
             logger.info("Mistral client initialized.")
-            SUPPORTED_MODELS["mistral"] = {"client": mistral_client, "type": "mistral_client", "name": DEFAULT_MISTRAL_MODEL}
+            SUPPORTED_MODELS["mistral"] = {
+                "client": mistral_client,
+                "type": "mistral_client",
+                "name": DEFAULT_MISTRAL_MODEL,
+                "agent_by_hint": {
+                    "code": CODE_AGENT or DEFAULT_MISTRAL_MODEL,
+                    "conversation": ARCH_AGENT or DEFAULT_MISTRAL_MODEL,
+                },
+            }
             if not CODE_AGENT: logger.warning(f"CODE_AGENT (target ID for Mistral code tasks) is not configured (env var '{CODE_AGENT_ENV_VAR}' missing or empty, and no default). Mistral 'code' hint may not use specialized agent.")
             if not ARCH_AGENT: logger.warning(f"ARCH_AGENT (target ID for Mistral conversation tasks) is not configured (env var '{ARCH_AGENT_ENV_VAR}' missing or empty, and no default). Mistral 'conversation' hint may not use specialized agent.")
         except AttributeError as ae:
@@ -88,7 +127,8 @@ def init_api_clients(
              codestral_client = mistral_client
         else:
             try:
-                codestral_client = Mistral(api_key=codestral_key)
+                from mistralai import Mistral
+                codestral_client = Mistral(api_key=codestral_key, client=_get_shared_http_client())
                 logger.info("Codestral client initialized (potentially new instance).")
             except Exception as e:
                 logger.error(f"Failed Codestral client init: {e}", exc_info=True)
@@ -105,7 +145,130 @@ def init_api_clients(
         logger.info(f"init_api_clients: Supported model clients after initialization: {list(SUPPORTED_MODELS.keys())}")
 
 
-GoogleGenAIContentType = Union[str, Dict[str, str], google_genai_types.Part]
+GoogleGenAIContentType = Union[str, Dict[str, str], "google_genai_types.Part"]
+
+def _chat_gemini(model_config: Dict[str, Any], user_content_parts: List[GoogleGenAIContentType], model_name: str, mode_hint: str) -> str:
+    from google import genai
+    from google.genai import types as google_genai_types
+
+    client_object = model_config["client"]
+    effective_gemini_model_str = model_config.get("api_model", model_config["name"])
+    is_multimodal_gemini_request = False
+
+    gemini_contents_list = []
+    for part_item in user_content_parts:
+        if isinstance(part_item, str):
+            gemini_contents_list.append(google_genai_types.Part(text=part_item))
+        elif isinstance(part_item, dict) and "mime_type" in part_item and "data" in part_item:
+            try:
+                img_bytes = base64.b64decode(part_item["data"])
+                image_blob = google_genai_types.Blob(mime_type=part_item["mime_type"], data=img_bytes)
+                image_part = google_genai_types.Part(inline_data=image_blob)
+                gemini_contents_list.append(image_part)
+                is_multimodal_gemini_request = True
+            except Exception as e_img:
+                logger.error(f"Error processing image part for Gemini (Client): {e_img}", exc_info=True)
+                return f"Error: Could not process image data for Gemini. {e_img}"
+        elif isinstance(part_item, google_genai_types.Part):
+            gemini_contents_list.append(part_item)
+            if part_item.inline_data and part_item.inline_data.mime_type.startswith("image/"):
+                is_multimodal_gemini_request = True
+        else:
+            logger.warning(f"Unsupported content part type for Gemini (Client): {type(part_item)}")
+            return f"Error: Unsupported content part type '{type(part_item)}' for Gemini."
+
+    logger.debug(f"Sending request to AI: model_name_key='{model_name}', api_type='gemini_client_models', actual_target='{effective_gemini_model_str}', mode_hint='{mode_hint}'.")
+
+    if not isinstance(client_object, genai.Client):
+        logger.error(f"Gemini client (client_object) is not a genai.Client instance. Type: {type(client_object)}")
+        return "Error: Misconfigured Gemini client instance."
+
+    response = client_object.models.generate_content(
+        model=effective_gemini_model_str,
+        contents=gemini_contents_list
+    )
+
+    if not response.candidates:
+        reason = "Unknown"; block_reason_message = ""
+        if hasattr(response, 'prompt_feedback'):
+            if response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
+                reason = response.prompt_feedback.block_reason.name
+                if hasattr(response.prompt_feedback, 'block_reason_message') and response.prompt_feedback.block_reason_message:
+                    block_reason_message = f" Message: {response.prompt_feedback.block_reason_message}"
+        logger.warning(f"Gemini response was blocked or empty. Reason: {reason}{block_reason_message}. Full feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
+        return f"Error: AI response blocked or empty (Reason: {reason}).{block_reason_message}"
+
+    agent_message = ""
+    try:
+        agent_message = "".join(
+            part.text for part in response.candidates[0].content.parts
+            if getattr(part, 'text', None) is not None
+        )
+    except (IndexError, AttributeError) as e_resp_parse:
+        logger.warning(f"Could not parse text from Gemini response candidate: {e_resp_parse}. Candidates: {response.candidates}", exc_info=True)
+        finish_reason_str = "N/A"
+        try:
+            if response.candidates and hasattr(response.candidates[0], 'finish_reason'):
+                finish_reason_str = response.candidates[0].finish_reason.name
+        except Exception: pass
+        return f"Error: Could not extract text from AI response. Finish Reason: {finish_reason_str}."
+
+    if not agent_message.strip() and not is_multimodal_gemini_request:
+        logger.warning(f"Gemini response (Client) resulted in no text. Candidates: {response.candidates}")
+        finish_reason_str = "N/A"
+        try:
+            if response.candidates and hasattr(response.candidates[0], 'finish_reason') and response.candidates[0].finish_reason:
+                finish_reason_str = response.candidates[0].finish_reason.name
+        except Exception: pass
+
+        if finish_reason_str not in ["STOP", "MAX_TOKENS"]:
+            return f"Error: Gemini AI returned no text. Finish Reason: {finish_reason_str}."
+    return agent_message
+
+def _chat_mistral(model_config: Dict[str, Any], user_content_parts: List[GoogleGenAIContentType], model_name: str, mode_hint: str) -> str:
+    from mistralai import Mistral
+
+    client_object = model_config["client"]
+    target_model_identifier = model_config["name"]
+    actual_model_target_for_mistral_type = model_config.get("agent_by_hint", {}).get(mode_hint, target_model_identifier)
+    if actual_model_target_for_mistral_type != target_model_identifier and logger.isEnabledFor(logging.INFO):
+        logger.info(f"Routing to Mistral agent: {actual_model_target_for_mistral_type} for '{model_name}' ({mode_hint} hint).")
+
+    text_parts: List[str] = []
+    has_non_text_parts = False
+    for part_item in user_content_parts:
+        if isinstance(part_item, str):
+            text_parts.append(part_item)
+        elif isinstance(part_item, dict) and "mime_type" in part_item:
+            logger.warning(f"Image data provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'. Mistral client typically handles text-only. Image will be ignored.")
+            has_non_text_parts = True
+
+    combined_text = "\n".join(text_parts).strip()
+    if not combined_text:
+        if has_non_text_parts:
+            return f"Error: No textual content provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'. Image data is ignored by this client."
+        return f"Error: No text content provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'."
+
+    logger.debug(f"Sending request to AI: model_name_key='{model_name}', api_type='mistral_client', actual_target='{actual_model_target_for_mistral_type}', mode_hint='{mode_hint}'.")
+
+    if not isinstance(client_object, Mistral):
+        logger.error(f"Mistral/Codestral client object is of wrong type: {type(client_object)}. Expected Mistral.")
+        return "Error: Internal configuration error - Mistral client type mismatch."
+
+    chat_response = client_object.chat(
+        model=actual_model_target_for_mistral_type,
+        messages=[{"role": "user", "content": combined_text}]
+    )
+    if not chat_response.choices:
+        logger.warning(f"Mistral/Codestral response had no choices. Response: {chat_response}")
+        return "Error: AI response from Mistral/Codestral was empty or malformed (no choices)."
+    return chat_response.choices[0].message.content
+
+# keyed by SUPPORTED_MODELS[...]["type"]; add a provider by registering its handler here
+_CHAT_HANDLERS: Dict[str, Callable[[Dict[str, Any], List[GoogleGenAIContentType], str, str], str]] = {
+    "gemini_client_models": _chat_gemini,
+    "mistral_client": _chat_mistral,
+}
 
 def chat_with_model(
     user_content_parts: List[GoogleGenAIContentType],
@@ -120,148 +283,12 @@ def chat_with_model(
             logger.error(err_msg)
             return err_msg
 
-        client_object = model_config["client"]
         api_type = model_config["type"]
-        target_model_identifier = model_config["name"]
-
-        effective_gemini_model_str = target_model_identifier
-        if api_type == 'gemini_client_models':
-            if not target_model_identifier.startswith("models/"):
-                effective_gemini_model_str = f"models/{target_model_identifier}"
-
-        actual_model_target_for_mistral_type = target_model_identifier
-        if api_type == 'mistral_client':
-            if model_name == 'mistral':
-                if mode_hint == 'code' and CODE_AGENT:
-                    actual_model_target_for_mistral_type = CODE_AGENT
-                    logger.info(f"Routing to Mistral CODE_AGENT: {actual_model_target_for_mistral_type} for '{model_name}' (code hint).")
-                elif mode_hint == 'conversation' and ARCH_AGENT:
-                    actual_model_target_for_mistral_type = ARCH_AGENT
-                    logger.info(f"Routing to Mistral ARCH_AGENT: {actual_model_target_for_mistral_type} for '{model_name}' (conversation hint).")
-
-        processed_api_content: Any
-        is_multimodal_gemini_request = False
-
-        if api_type == 'gemini_client_models':
-            gemini_contents_list = []
-            for part_item in user_content_parts:
-                if isinstance(part_item, str):
-                    gemini_contents_list.append(google_genai_types.Part(text=part_item))
-                elif isinstance(part_item, dict) and "mime_type" in part_item and "data" in part_item:
-                    try:
-                        img_bytes = base64.b64decode(part_item["data"])
-                        image_blob = google_genai_types.Blob(mime_type=part_item["mime_type"], data=img_bytes)
-                        image_part = google_genai_types.Part(inline_data=image_blob)
-                        gemini_contents_list.append(image_part)
-                        is_multimodal_gemini_request = True
-                    except Exception as e_img:
-                        logger.error(f"Error processing image part for Gemini (Client): {e_img}", exc_info=True)
-                        return f"Error: Could not process image data for Gemini. {e_img}"
-                elif isinstance(part_item, google_genai_types.Part):
-                    gemini_contents_list.append(part_item)
-                    if part_item.inline_data and part_item.inline_data.mime_type.startswith("image/"):
-                        is_multimodal_gemini_request = True
-                else:
-                    logger.warning(f"Unsupported content part type for Gemini (Client): {type(part_item)}")
-                    return f"Error: Unsupported content part type '{type(part_item)}' for Gemini."
-            processed_api_content = gemini_contents_list
-
-        elif api_type == 'mistral_client':
-            combined_text = ""
-            has_non_text_parts = False
-            for part_item in user_content_parts:
-                if isinstance(part_item, str):
-                    combined_text += part_item + "\n"
-                elif isinstance(part_item, dict) and "mime_type" in part_item:
-                    logger.warning(f"Image data provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'. Mistral client typically handles text-only. Image will be ignored.")
-                    has_non_text_parts = True
-
-            if not combined_text.strip():
-                if has_non_text_parts:
-                    return f"Error: No textual content provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'. Image data is ignored by this client."
-                return f"Error: No text content provided for Mistral/Codestral model '{actual_model_target_for_mistral_type}'."
-
-            processed_api_content = [{"role": "user", "content": combined_text.strip()}]
-        else:
-            logger.error(f"Internal Error: No content processing logic defined for api_type '{api_type}'.")
+        chat_handler = _CHAT_HANDLERS.get(api_type)
+        if chat_handler is None:
+            logger.error(f"Internal Error: No chat handler defined for api_type '{api_type}'.")
             return f"Error: Internal configuration error - unknown api_type '{api_type}'."
-
-        target_for_logging = effective_gemini_model_str if api_type == 'gemini_client_models' else actual_model_target_for_mistral_type
-        logger.debug(f"Sending request to AI: model_name_key='{model_name}', api_type='{api_type}', actual_target='{target_for_logging}', mode_hint='{mode_hint}'.")
-
-        if api_type == "gemini_client_models":
-            if not isinstance(client_object, genai.Client):
-                logger.error(f"Gemini client (client_object) is not a genai.Client instance. Type: {type(client_object)}")
-                return "Error: Misconfigured Gemini client instance."
-
-            gemini_request_config: Optional[google_genai_types.GenerateContentConfig] = None
-
-#             if mode_hint == 'code':
-#                 gemini_request_config = google_genai_types.GenerateContentConfig(
-#                     stop_sequences=["```"]
-#                 )
-#                 logger.debug("Applying stop_sequences for Gemini (Client) via GenerateContentConfig object passed to 'config' parameter.")
-
-            response = client_object.models.generate_content(
-                model=effective_gemini_model_str,
-                contents=processed_api_content,
-                config=gemini_request_config
-            )
-
-            if not response.candidates:
-                 reason = "Unknown"; block_reason_message = ""
-                 if hasattr(response, 'prompt_feedback'):
-                     if response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
-                         reason = response.prompt_feedback.block_reason.name
-                         if hasattr(response.prompt_feedback, 'block_reason_message') and response.prompt_feedback.block_reason_message:
-                             block_reason_message = f" Message: {response.prompt_feedback.block_reason_message}"
-                 logger.warning(f"Gemini response was blocked or empty. Reason: {reason}{block_reason_message}. Full feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-                 return f"Error: AI response blocked or empty (Reason: {reason}).{block_reason_message}"
-
-            agent_message = ""
-            try:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'text') and part.text is not None:
-                        agent_message += part.text
-            except (IndexError, AttributeError) as e_resp_parse:
-                logger.warning(f"Could not parse text from Gemini response candidate: {e_resp_parse}. Candidates: {response.candidates}", exc_info=True)
-                finish_reason_str = "N/A"
-                try:
-                    if response.candidates and hasattr(response.candidates[0], 'finish_reason'):
-                        finish_reason_str = response.candidates[0].finish_reason.name
-                except Exception: pass
-                return f"Error: Could not extract text from AI response. Finish Reason: {finish_reason_str}."
-
-            if not agent_message.strip() and not is_multimodal_gemini_request:
-                logger.warning(f"Gemini response (Client) resulted in no text. Candidates: {response.candidates}")
-                finish_reason_str = "N/A"
-                try:
-                    if response.candidates and hasattr(response.candidates[0], 'finish_reason') and response.candidates[0].finish_reason:
-                        finish_reason_str = response.candidates[0].finish_reason.name
-                except Exception: pass
-
-                if finish_reason_str not in ["STOP", "MAX_TOKENS"]:
-                    return f"Error: Gemini AI returned no text. Finish Reason: {finish_reason_str}."
-            return agent_message
-
-        elif api_type == "mistral_client":
-             if not isinstance(client_object, Mistral):
-                 logger.error(f"Mistral/Codestral client object is of wrong type: {type(client_object)}. Expected Mistral.")
-                 return "Error: Internal configuration error - Mistral client type mismatch."
-
-             chat_response = client_object.chat(
-                 model=actual_model_target_for_mistral_type,
-                 messages=processed_api_content
-             )
-             if chat_response.choices:
-                 agent_message: str = chat_response.choices[0].message.content
-             else:
-                 logger.warning(f"Mistral/Codestral response had no choices. Response: {chat_response}")
-                 return "Error: AI response from Mistral/Codestral was empty or malformed (no choices)."
-             return agent_message
-        else:
-            logger.error(f"Internal Error: Invalid api_type '{api_type}' encountered during API call phase.")
-            return f"Error: Internal routing error (unhandled api_type: {api_type})."
+        return chat_handler(model_config, user_content_parts, model_name, mode_hint)
 
     except AttributeError as e_attr:
         logger.error(f"AttributeError during AI API call (model='{model_name}', hint='{mode_hint}'): {e_attr}", exc_info=True)
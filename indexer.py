@@ -1,6 +1,6 @@
 import os, logging
-from typing import Dict, List, Any, Set, Optional
-from os.path import join, isfile, isdir, relpath, abspath, basename, getsize
+from typing import Dict, List, Any, Set, Optional, Tuple
+from os.path import isdir, abspath, basename
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +16,12 @@ class ProjectIndexer:
     def __init__(self, base_path: str, ignore_patterns: Optional[Set[str]] = None):
         self.base_path: str = abspath(base_path)
         self.ignore_patterns: Set[str] = ignore_patterns if ignore_patterns is not None else DEFAULT_INDEXER_IGNORE_PATTERNS
+        self._exact: Set[str] = {p for p in self.ignore_patterns if not (p.startswith('*') or p.endswith('*'))}
+        self._suffix_tuple: Tuple[str, ...] = tuple(p[1:] for p in self.ignore_patterns if p.startswith('*'))
+        self._prefix_tuple: Tuple[str, ...] = tuple(p[:-1] for p in self.ignore_patterns if p.endswith('*'))
         self.file_index: Dict[str, Dict[str, Any]] = {}
-        self.project_tree_str: str = "[Project tree not yet generated]"
+        self._tree_entries: List[Tuple[int, str, bool]] = []
+        self._tree_str_cache: Optional[str] = "[Project tree not yet generated]"
         if not isdir(self.base_path):
             logger.warning(f"ProjectIndexer base path is not a directory: {self.base_path}. Index will be empty. Creating directory now.")
             try:
@@ -26,56 +30,81 @@ class ProjectIndexer:
             except OSError as e:
                 logger.error(f"Failed to create base_path directory {self.base_path}: {e}", exc_info=True)
 
-    def _should_ignore(self, name: str, full_path: str) -> bool:
-        if name in self.ignore_patterns:
-            return True
-        if name.startswith('.') and name not in {'.env'}:
-            return True
-        for pattern in self.ignore_patterns:
-            if pattern.startswith('*') and name.endswith(pattern[1:]):
-                return True
-            if pattern.endswith('*') and name.startswith(pattern[:-1]):
-                return True
-        return False
+    def _should_ignore(self, name: str) -> bool:
+        # hot: called for every directory entry during refresh_index
+        return (name in self._exact
+                or (name[0] == '.' and name != '.env')
+                or name.endswith(self._suffix_tuple)
+                or name.startswith(self._prefix_tuple))
 
     def refresh_index(self) -> None:
         logger.info(f"Starting full scan of project: {self.base_path}")
+        self._tree_str_cache = None
         new_file_index: Dict[str, Dict[str, Any]] = {}
-        tree_lines: List[str] = [basename(self.base_path) + "/"]
+        tree_entries: List[Tuple[int, str, bool]] = [(0, basename(self.base_path), True)]
         if not isdir(self.base_path):
             logger.error(f"Base path {self.base_path} is not a directory. Cannot scan.")
-            self.project_tree_str = "[Error: Base project path not found or not a directory]"
+            self._tree_entries = []
+            self._tree_str_cache = "[Error: Base project path not found or not a directory]"
             self.file_index = {}
             return
         try:
-            for dir_path_str, dir_names_list, file_names_list in os.walk(self.base_path, topdown=True, onerror=None):
-                dir_names_list[:] = [d for d in dir_names_list if not self._should_ignore(d, join(dir_path_str, d))]
-                current_relative_dir_path = relpath(dir_path_str, self.base_path)
-                depth = 0 if current_relative_dir_path == '.' else current_relative_dir_path.count(os.sep) + 1
-                indent = '  ' * depth
-                for dir_name in sorted(dir_names_list):
-                    tree_lines.append(f"{indent}{dir_name}/")
-                for file_name in sorted(file_names_list):
-                    file_absolute_path = join(dir_path_str, file_name)
-                    if self._should_ignore(file_name, file_absolute_path) or not isfile(file_absolute_path):
+            # bound once: these are called for every entry in the tree
+            should_ignore = self._should_ignore
+            append_tree_entry = tree_entries.append
+            pending_dirs: List[Tuple[str, str, int]] = [(self.base_path, "", 0)]
+            push_dir = pending_dirs.append
+            pop_dir = pending_dirs.pop
+            while pending_dirs:
+                dir_path_str, rel_prefix, depth = pop_dir()
+                try:
+                    with os.scandir(dir_path_str) as dir_iter:
+                        dir_entries = list(dir_iter)
+                except OSError as e_scandir:
+                    logger.warning(f"Could not scan directory {dir_path_str} during indexing: {e_scandir}")
+                    continue
+                sub_dirs: List[os.DirEntry] = []
+                files: List[os.DirEntry] = []
+                add_sub_dir = sub_dirs.append
+                add_file = files.append
+                for entry in dir_entries:
+                    if should_ignore(entry.name):
                         continue
-                    file_relative_path = relpath(file_absolute_path, self.base_path)
-                    tree_lines.append(f"{indent}{file_name}")
                     try:
-                        new_file_index[file_relative_path.replace('\\', '/')] = {
-                            "abs_path": file_absolute_path,
-                            "size_bytes": getsize(file_absolute_path),
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        add_sub_dir(entry)
+                    else:
+                        add_file(entry)
+                sub_dirs.sort(key=lambda e: e.name)
+                files.sort(key=lambda e: e.name)
+                for dir_entry in sub_dirs:
+                    append_tree_entry((depth, dir_entry.name, True))
+                for dir_entry in reversed(sub_dirs):
+                    if not dir_entry.is_symlink():
+                        push_dir((dir_entry.path, f"{rel_prefix}{dir_entry.name}/", depth + 1))
+                for file_entry in files:
+                    try:
+                        if not file_entry.is_file():
+                            continue
+                        append_tree_entry((depth, file_entry.name, False))
+                        new_file_index[f"{rel_prefix}{file_entry.name}"] = {
+                            "abs_path": file_entry.path,
+                            "size_bytes": file_entry.stat().st_size,
                         }
                     except OSError as e_file_stat:
-                        logger.warning(f"Could not stat file {file_absolute_path} during indexing: {e_file_stat}")
+                        logger.warning(f"Could not stat file {file_entry.path} during indexing: {e_file_stat}")
                     except Exception as e_file_proc:
-                        logger.warning(f"Error processing file {file_absolute_path} during indexing: {e_file_proc}", exc_info=True)
+                        logger.warning(f"Error processing file {file_entry.path} during indexing: {e_file_proc}", exc_info=True)
             self.file_index = new_file_index
-            self.project_tree_str = "\n".join(tree_lines)
-            logger.info(f"Project scan complete. Indexed {len(self.file_index)} files. Tree generated.")
+            self._tree_entries = tree_entries
+            logger.info(f"Project scan complete. Indexed {len(self.file_index)} files.")
         except Exception as e_walk:
             logger.error(f"Error during project walk for indexing ({self.base_path}): {e_walk}", exc_info=True)
-            self.project_tree_str = "[Error generating project tree during scan]"
+            self._tree_entries = []
+            self._tree_str_cache = "[Error generating project tree during scan]"
             self.file_index = {}
 
     def get_file_content(self, relative_path_key: str, max_size_bytes: int = 2 * 1024 * 1024) -> Optional[str]:
@@ -91,9 +120,8 @@ class ProjectIndexer:
             if file_info["size_bytes"] > max_size_bytes:
                 logger.info(f"File {normalized_rel_path} ({file_info['size_bytes']} bytes) is too large to load full content (limit: {max_size_bytes} bytes).")
                 return f"[Content of '{normalized_rel_path}' is too large to include fully ({file_info['size_bytes'] / (1024*1024):.2f}MB). Consider adding it to context with /add if essential.]"
-            with open(abs_path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-            return content
+            with open(abs_path, 'rb') as f:
+                return f.read().decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
         except FileNotFoundError:
             logger.warning(f"File not found at {abs_path} though it was indexed. Consider re-indexing.")
             return f"[Error: File '{normalized_rel_path}' not found on disk. Please /reindex.]"
@@ -105,7 +133,11 @@ class ProjectIndexer:
             return f"[Unexpected error reading content of '{normalized_rel_path}']"
 
     def get_project_tree(self) -> str:
-        return self.project_tree_str
+        if self._tree_str_cache is None:
+            self._tree_str_cache = "\n".join(
+                f"{'  ' * depth}{name}{'/' if is_dir else ''}" for depth, name, is_dir in self._tree_entries
+            )
+        return self._tree_str_cache
 
     def find_files_by_name_substring(self, substring: str, top_n: int = 10) -> List[Dict[str, Any]]:
         relevant_files: List[Dict[str, Any]] = []
@@ -1,5 +1,7 @@
-import os, sys, logging
+import os, sys, stat, queue, atexit, logging, functools, threading
 import agent,database,helper
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, RotatingFileHandler
+from dataclasses import dataclass
 from typing import Optional
 from colorama import Fore, Style, init as colorama_init
 from dotenv import load_dotenv
@@ -10,30 +12,60 @@ DEFAULT_ENV_PATH = os.path.join(PROJECT_ROOT, 'files/.env')
 DEFAULT_LOG_FILENAME = 'files/logs.txt'
 DEFAULT_DB_FILENAME = 'files/automate.db'
 DEFAULT_CODE_FOLDER_NAME = 'Code'
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUP_COUNT = 1
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL_SECONDS = 30.0
+LOG_MEMORY_CAPACITY = 512
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(filename)s:%(lineno)d - %(message)s'
 
-try:
-    env_path_to_load = os.getenv('AUTOMATE_ENV_PATH', DEFAULT_ENV_PATH)
-    if os.path.exists(env_path_to_load):
-        load_dotenv(dotenv_path=env_path_to_load)
-    else:
-        if env_path_to_load == DEFAULT_ENV_PATH:
-            print(f"{Fore.YELLOW}Warning: Default .env file not found at {DEFAULT_ENV_PATH}. "
-                  f"Relying on system environment variables if set.{Style.RESET_ALL}")
-except Exception as e_dotenv:
-    print(f"{Fore.RED}Error loading .env file: {e_dotenv}{Style.RESET_ALL}")
-
-# --- Paths ---
-LOG_FILE_PATH = os.path.join(PROJECT_ROOT, os.getenv('LOG_FILE_PATH', DEFAULT_LOG_FILENAME))
-DATABASE_PATH = os.path.join(PROJECT_ROOT, os.getenv('DATABASE_PATH', DEFAULT_DB_FILENAME))
-CODE_FOLDER_PATH = os.path.join(PROJECT_ROOT, os.getenv('CODE_FOLDER_PATH', DEFAULT_CODE_FOLDER_NAME))
-
-# --- API Keys ---
-GEMINI_API_KEY: Optional[str] = os.getenv('GEMINI_API_KEY')
-MISTRAL_API_KEY: Optional[str] = os.getenv('MISTRAL_API_KEY')
-CODESTRAL_API_KEY: Optional[str] = os.getenv('CODESTRAL_API_KEY')
-DEFAULT_ADMIN_MODE_ENV: Optional[str] = os.getenv('DEFAULT_ADMIN_MODE_ENABLED')
-CODE_AGENT_ID: Optional[str] = os.getenv('CODE_AGENT_ID')
-ARCHITECT_AGENT_ID: Optional[str] = os.getenv('ARCHITECT_AGENT_ID')
+@functools.lru_cache(maxsize=1)
+def _load_env_once() -> None:
+    try:
+        env_path_to_load = os.getenv('AUTOMATE_ENV_PATH', DEFAULT_ENV_PATH)
+        if os.path.exists(env_path_to_load):
+            load_dotenv(dotenv_path=env_path_to_load)
+        else:
+            if env_path_to_load == DEFAULT_ENV_PATH:
+                print(f"{Fore.YELLOW}Warning: Default .env file not found at {DEFAULT_ENV_PATH}. "
+                      f"Relying on system environment variables if set.{Style.RESET_ALL}")
+    except Exception as e_dotenv:
+        print(f"{Fore.RED}Error loading .env file: {e_dotenv}{Style.RESET_ALL}")
+
+def clear_env_cache() -> None:
+    _load_env_once.cache_clear()
+
+# --- Config ---
+@dataclass(frozen=True)
+class AppConfig:
+    log_file_path: str
+    database_path: str
+    code_folder_path: str
+    gemini_key: Optional[str]
+    mistral_key: Optional[str]
+    codestral_key: Optional[str]
+    default_admin_mode: Optional[str]
+    code_agent_id: Optional[str]
+    architect_agent_id: Optional[str]
+    log_level: int
+
+def _build_config() -> AppConfig:
+    _load_env_once()
+    log_level_value = logging.getLevelName(os.getenv('LOG_LEVEL', 'WARNING').upper())
+    return AppConfig(
+        log_file_path=os.path.join(PROJECT_ROOT, os.getenv('LOG_FILE_PATH', DEFAULT_LOG_FILENAME)),
+        database_path=os.path.join(PROJECT_ROOT, os.getenv('DATABASE_PATH', DEFAULT_DB_FILENAME)),
+        code_folder_path=os.path.join(PROJECT_ROOT, os.getenv('CODE_FOLDER_PATH', DEFAULT_CODE_FOLDER_NAME)),
+        gemini_key=os.getenv('GEMINI_API_KEY'),
+        mistral_key=os.getenv('MISTRAL_API_KEY'),
+        codestral_key=os.getenv('CODESTRAL_API_KEY'),
+        default_admin_mode=os.getenv('DEFAULT_ADMIN_MODE_ENABLED'),
+        code_agent_id=os.getenv('CODE_AGENT_ID'),
+        architect_agent_id=os.getenv('ARCHITECT_AGENT_ID'),
+        log_level=log_level_value if isinstance(log_level_value, int) else logging.WARNING,
+    )
+
+CONFIG: AppConfig = _build_config()
 
 # --- Initialization ---
 try:
@@ -42,33 +74,96 @@ except Exception as e_colorama:
     print(f"Warning: Failed to initialize colorama: {e_colorama}. Colored output might not work.")
 
 # --- Logging ---
+class FastRotatingFileHandler(RotatingFileHandler):
+    """Buffered RotatingFileHandler that tracks the file size itself and only flushes on flushLevel records."""
+
+    def __init__(self, filename: str, mode: str = 'a', maxBytes: int = 0, backupCount: int = 0,
+                 encoding: Optional[str] = None, delay: bool = False, flushLevel: int = logging.ERROR):
+        self.flushLevel: int = flushLevel
+        super().__init__(filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=delay)
+        try:
+            self._approx_size: int = os.path.getsize(self.baseFilename)
+        except OSError:
+            self._approx_size = 0
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=LOG_BUFFER_BYTES, encoding=self.encoding, errors=self.errors)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self._approx_size = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            if self.maxBytes > 0 and self._approx_size + len(msg) >= self.maxBytes:
+                if self.shouldRollover(record):
+                    self.doRollover()
+                elif self.stream is not None:
+                    self._approx_size = self.stream.tell()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._approx_size += len(msg)
+            if record.levelno >= self.flushLevel:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+class DeferredFormatQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting (including tracebacks) to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args are merged here because callers may mutate them after logging returns
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def _start_periodic_flush(interval: float, *handlers: logging.Handler) -> None:
+    def _tick() -> None:
+        for handler in handlers:
+            handler.flush()
+        _start_periodic_flush(interval, *handlers)
+    timer = threading.Timer(interval, _tick)
+    timer.daemon = True
+    timer.start()
+
 logger: Optional[logging.Logger] = None
 try:
-    log_dir = os.path.dirname(LOG_FILE_PATH)
+    log_dir = os.path.dirname(CONFIG.log_file_path)
     if log_dir:
         os.makedirs(log_dir, exist_ok=True)
 
-    logging.basicConfig(
-        level=logging.WARNING,
-        format='%(asctime)s - %(levelname)s - %(name)s - %(filename)s:%(lineno)d - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE_PATH, encoding='utf-8', mode='a'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    log_formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = FastRotatingFileHandler(CONFIG.log_file_path, mode='a', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(log_formatter)
+    memory_handler = MemoryHandler(capacity=LOG_MEMORY_CAPACITY, flushLevel=logging.ERROR, target=file_handler)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(log_formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = DeferredFormatQueueHandler(log_queue)
+    logging.basicConfig(level=CONFIG.log_level, handlers=[queue_handler])
+
+    log_listener = QueueListener(log_queue, memory_handler, console_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    _start_periodic_flush(LOG_FLUSH_INTERVAL_SECONDS, memory_handler, file_handler)
     logger = logging.getLogger("automate_main")
     logger.info("Logging configured successfully.")
-    logger.info(f"Directory set to: {CODE_FOLDER_PATH}")
+    logger.info(f"Directory set to: {CONFIG.code_folder_path}")
 
 except OSError as e_log_os:
-    print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not create log directory or file '{LOG_FILE_PATH}': {e_log_os}{Style.RESET_ALL}")
+    print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not create log directory or file '{CONFIG.log_file_path}': {e_log_os}{Style.RESET_ALL}")
     sys.exit(1)
 except Exception as e_log_generic:
      print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not configure logging: {e_log_generic}{Style.RESET_ALL}")
      sys.exit(1)
 
 
-def main_application_logic():
+def main_application_logic(cfg: AppConfig):
 
     if not logger:
         print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Logger not initialized.{Style.RESET_ALL}")
@@ -78,9 +173,11 @@ def main_application_logic():
 
     try:
         helper.init_api_clients(
-            gemini_key=GEMINI_API_KEY,
-            mistral_key=MISTRAL_API_KEY,
-            codestral_key=CODESTRAL_API_KEY
+            gemini_key=cfg.gemini_key,
+            mistral_key=cfg.mistral_key,
+            codestral_key=cfg.codestral_key,
+            code_agent_id=cfg.code_agent_id,
+            architect_agent_id=cfg.architect_agent_id
         )
         if not helper.SUPPORTED_MODELS:
              logger.critical("No AI models could be initialized. Check API keys and previous logs.")
@@ -95,20 +192,20 @@ def main_application_logic():
 
     db_connection = None
     try:
-        db_connection = database.connect(db_path=DATABASE_PATH)
+        db_connection = database.connect(db_path=cfg.database_path)
         if not db_connection:
-             logger.critical(f"Database connection function returned None for path: {DATABASE_PATH}.")
+             logger.critical(f"Database connection function returned None for path: {cfg.database_path}.")
              print(f"{Fore.RED}{Style.BRIGHT}Error: Could not establish database connection (connect returned None).{Style.RESET_ALL}")
              sys.exit(1)
-        logger.info(f"Database connection established: {DATABASE_PATH}")
-    except database.ConnectionError as db_err:
-         logger.critical(f"Failed to connect to the database at {DATABASE_PATH}: {db_err}", exc_info=True)
+        logger.info(f"Database connection established: {cfg.database_path}")
+    except database.DatabaseConnectionError as db_err:
+         logger.critical(f"Failed to connect to the database at {cfg.database_path}: {db_err}", exc_info=True)
          print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not connect to the database. "
-               f"Check path/permissions: {DATABASE_PATH}{Style.RESET_ALL}")
+               f"Check path/permissions: {cfg.database_path}{Style.RESET_ALL}")
          print(f"{Fore.RED}{Style.DIM}Details: {db_err}{Style.RESET_ALL}")
          sys.exit(1)
     except Exception as e_db_unexpected:
-        logger.critical(f"Unexpected error connecting to database {DATABASE_PATH}: {e_db_unexpected}", exc_info=True)
+        logger.critical(f"Unexpected error connecting to database {cfg.database_path}: {e_db_unexpected}", exc_info=True)
         print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Unexpected database connection issue: {e_db_unexpected}{Style.RESET_ALL}")
         sys.exit(1)
 
@@ -116,48 +213,51 @@ def main_application_logic():
     try:
         chatbot_instance = agent.ChatBot(
             db_conn=db_connection,
-            code_folder_path=CODE_FOLDER_PATH, 
-            default_admin_mode=DEFAULT_ADMIN_MODE_ENV
+            code_folder_path=cfg.code_folder_path, 
+            default_admin_mode=cfg.default_admin_mode
         )
         logger.info("ChatBot initialized. Starting interaction loop...")
         chatbot_instance.start()
 
     except RuntimeError as rt_err:
         logger.critical(f"ChatBot initialization failed with RuntimeError: {rt_err}", exc_info=True)
-        print(f"{Fore.RED}{Style.BRIGHT}Fatal Error during ChatBot setup: {rt_err}. Check logs at {LOG_FILE_PATH}{Style.RESET_ALL}")
+        print(f"{Fore.RED}{Style.BRIGHT}Fatal Error during ChatBot setup: {rt_err}. Check logs at {cfg.log_file_path}{Style.RESET_ALL}")
         if db_connection: db_connection.close()
         sys.exit(1)
     except Exception as e_chatbot:
         logger.exception("An unexpected error occurred during ChatBot initialization or execution.")
         print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: An unexpected issue with the ChatBot occurred: {e_chatbot}. "
-              f"Check logs at {LOG_FILE_PATH} for details.{Style.RESET_ALL}")
+              f"Check logs at {cfg.log_file_path} for details.{Style.RESET_ALL}")
         if db_connection: db_connection.close()
         sys.exit(1)
     
     logger.info("AI Coding Assistant finished normally.")
 
-def run_initial_checks_and_setup():
-    if not GEMINI_API_KEY and not MISTRAL_API_KEY and not CODESTRAL_API_KEY:
+def run_initial_checks_and_setup(cfg: AppConfig):
+    if not cfg.gemini_key and not cfg.mistral_key and not cfg.codestral_key:
         print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: At least one API key (GEMINI_API_KEY, MISTRAL_API_KEY, or CODESTRAL_API_KEY) "
               f"must be configured in your .env file or system environment.{Style.RESET_ALL}")
         sys.exit(1)
     
     try:
-        if not os.path.exists(CODE_FOLDER_PATH):
-            print(f"{Fore.YELLOW}Note: Code Folder at '{CODE_FOLDER_PATH}' does not exist. It will be created.{Style.RESET_ALL}")
-            os.makedirs(CODE_FOLDER_PATH, exist_ok=True)
-        elif not os.path.isdir(CODE_FOLDER_PATH):
-            print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: The configured Code Folder path '{CODE_FOLDER_PATH}' exists but is not a directory.{Style.RESET_ALL}")
-            sys.exit(1)
+        try:
+            code_folder_stat = os.stat(cfg.code_folder_path)
+        except FileNotFoundError:
+            print(f"{Fore.YELLOW}Note: Code Folder at '{cfg.code_folder_path}' does not exist. It will be created.{Style.RESET_ALL}")
+            os.makedirs(cfg.code_folder_path, exist_ok=True)
+        else:
+            if not stat.S_ISDIR(code_folder_stat.st_mode):
+                print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: The configured Code Folder path '{cfg.code_folder_path}' exists but is not a directory.{Style.RESET_ALL}")
+                sys.exit(1)
     except OSError as e_codefolder:
-        print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not create or access Code Folder at '{CODE_FOLDER_PATH}': {e_codefolder}{Style.RESET_ALL}")
+        print(f"{Fore.RED}{Style.BRIGHT}Fatal Error: Could not create or access Code Folder at '{cfg.code_folder_path}': {e_codefolder}{Style.RESET_ALL}")
         sys.exit(1)
 
 
 if __name__ == "__main__":
     try:
-        run_initial_checks_and_setup()
-        main_application_logic()
+        run_initial_checks_and_setup(CONFIG)
+        main_application_logic(CONFIG)
     except SystemExit:
         if logger: logger.info("Application exiting via SystemExit.")
         else: print("Application exiting.")
@@ -1,8 +1,30 @@
-import io, base64, asyncio, logging, mss
-from typing import Optional, Dict
+import io, zlib, base64, asyncio, logging, threading, mss
+from typing import Any, Optional, Dict, List, Tuple
 import mss.tools
+from concurrent.futures import ThreadPoolExecutor
 import PIL.Image
 
+try:
+    import numpy
+    from turbojpeg import TurboJPEG, TJPF_BGRX
+    _TURBO_JPEG: Optional[Any] = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG/numpy not installed or libturbojpeg missing; Pillow is used instead
+    _TURBO_JPEG = None
+
+try:
+    from pybase64 import b64encode_as_string as _b64encode_str
+except ImportError:
+    def _b64encode_str(data: bytes) -> str:
+        return base64.b64encode(data).decode('ascii')
+
+try:
+    from xxhash import xxh3_64_intdigest as _frame_hash
+except ImportError:
+    _frame_hash = zlib.crc32
+
+JPEG_QUALITY = 85
+
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
     _handler = logging.StreamHandler()
@@ -13,24 +35,52 @@ if not logger.hasHandlers():
 
 class ScreenGrabber:
     def __init__(self):
+        # mss handles are bound to the thread that created them, so keep one per thread
+        self._local = threading.local()
+        self._instances: List[Any] = []
+        self._instances_lock = threading.Lock()
+        # (frame hash, frame size, requested format, result) of the last encoded capture
+        self._last_frame: Optional[Tuple[int, Tuple[int, int], str, Dict[str, str]]] = None
+        # captures get their own worker so they never queue behind the shared to_thread pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='screengrab', initializer=self._init_worker)
+
+    def _init_worker(self) -> None:
         try:
-            mss.mss() 
+            self._get_sct()
         except Exception as e:
             logger.error(f"Failed to pre-initialize mss in ScreenGrabber: {e}", exc_info=True)
 
-    def _capture_screen_to_png_bytes(self) -> Optional[bytes]:
+    def _get_sct(self) -> Any:
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            if len(sct.monitors) >= 2:
+                self._local.monitor = sct.monitors[1]
+            else:
+                logger.warning("Primary monitor (index 1) not found. Capturing entire virtual screen (index 0).")
+                self._local.monitor = sct.monitors[0]
+            self._local.sct = sct
+            with self._instances_lock:
+                self._instances.append(sct)
+        return sct
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._instances_lock:
+            instances, self._instances = self._instances, []
+        for sct in instances:
+            try:
+                sct.close()
+            except Exception as e:
+                logger.warning(f"Error closing mss instance: {e}")
+        self._local = threading.local()
+
+    def _capture_raw(self) -> Optional[Any]:
         try:
-            with mss.mss() as sct:
-                if len(sct.monitors) >= 2:
-                    monitor_to_capture = sct.monitors[1]
-                else:
-                    logger.warning("Primary monitor (index 1) not found. Capturing entire virtual screen (index 0).")
-                    monitor_to_capture = sct.monitors[0]
-
-                sct_img = sct.grab(monitor_to_capture)
-                img_bytes = mss.tools.to_png(sct_img.rgb, sct_img.size)
-                logger.debug(f"Screen captured successfully ({sct_img.width}x{sct_img.height}).")
-                return img_bytes
+            sct = self._get_sct()
+            sct_img = sct.grab(self._local.monitor)
+            logger.debug(f"Screen captured successfully ({sct_img.width}x{sct_img.height}).")
+            return sct_img
         except mss.exception.ScreenShotError as e:
             logger.error(f"MSS ScreenShotError during screen capture: {e}", exc_info=True)
             return None
@@ -38,38 +88,53 @@ class ScreenGrabber:
             logger.error(f"Generic error during MSS screen capture: {e}", exc_info=True)
             return None
 
+    def _encode_jpeg(self, sct_img: Any) -> bytes:
+        if _TURBO_JPEG is not None:
+            frame = numpy.frombuffer(sct_img.bgra, dtype=numpy.uint8).reshape(sct_img.height, sct_img.width, 4)
+            return _TURBO_JPEG.encode(frame, quality=JPEG_QUALITY, pixel_format=TJPF_BGRX)
+        # encode straight from the BGRA frame; no PNG round-trip
+        pil_image = PIL.Image.frombuffer('RGB', sct_img.size, sct_img.bgra, 'raw', 'BGRX', 0, 1)
+        jpeg_buffer = io.BytesIO()
+        pil_image.save(jpeg_buffer, format="JPEG", quality=JPEG_QUALITY)
+        return jpeg_buffer.getvalue()
+
     def get_screen_capture_base64(self, output_format: str = "PNG") -> Optional[Dict[str, str]]:
         try:
-            png_image_bytes = self._capture_screen_to_png_bytes()
-            if not png_image_bytes:
+            sct_img = self._capture_raw()
+            if sct_img is None:
                 return None
 
-            final_image_bytes = png_image_bytes
-            mime_type = "image/png"
             requested_format = output_format.upper()
+            frame_hash = _frame_hash(sct_img.raw)
+            last_frame = self._last_frame
+            if last_frame is not None and last_frame[:3] == (frame_hash, sct_img.size, requested_format):
+                logger.debug("Screen unchanged since last capture; reusing encoded image.")
+                return dict(last_frame[3])
+
+            final_image_bytes: Optional[bytes] = None
+            mime_type = "image/png"
 
             if requested_format == "JPEG":
                 try:
-                    pil_image = PIL.Image.open(io.BytesIO(png_image_bytes))
-                    if pil_image.mode in ('RGBA', 'LA', 'P'):
-                        pil_image = pil_image.convert('RGB')
-                    
-                    jpeg_buffer = io.BytesIO()
-                    pil_image.save(jpeg_buffer, format="JPEG", quality=85)
-                    final_image_bytes = jpeg_buffer.getvalue()
+                    final_image_bytes = self._encode_jpeg(sct_img)
                     mime_type = "image/jpeg"
-                    logger.debug("Converted screenshot to JPEG format.")
+                    logger.debug("Encoded screenshot as JPEG.")
                 except Exception as e:
-                    logger.error(f"Error converting image to JPEG: {e}. Falling back to PNG.", exc_info=True)
+                    logger.error(f"Error encoding image as JPEG: {e}. Falling back to PNG.", exc_info=True)
             elif requested_format != "PNG":
                 logger.warning(f"Unsupported image format: {output_format}. Defaulting to PNG.")
 
-            encoded_string = base64.b64encode(final_image_bytes).decode('utf-8')
-            
-            return {
+            if final_image_bytes is None:
+                final_image_bytes = mss.tools.to_png(sct_img.rgb, sct_img.size)
+
+            encoded_string = _b64encode_str(final_image_bytes)
+
+            result = {
                 "mime_type": mime_type,
                 "data": encoded_string
             }
+            self._last_frame = (frame_hash, sct_img.size, requested_format, result)
+            return dict(result)
         except Exception as e:
             logger.error(f"Error in get_screen_capture_base64: {e}", exc_info=True)
             return None
@@ -80,7 +145,8 @@ class ScreenGrabber:
                 logger.warning(f"output_format was not a string ({type(output_format)}), defaulting to PNG.")
                 output_format = "PNG"
 
-            result = await asyncio.to_thread(self.get_screen_capture_base64, output_format)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, self.get_screen_capture_base64, output_format)
             return result
         except Exception as e:
             logger.error(f"Error in async screen capture execution: {e}", exc_info=True)
@@ -1,24 +1,108 @@
 import speech_recognition as sr
-import logging
-from typing import Optional
+import os, json, time, queue, logging, threading
+from typing import Callable, Optional
 
 logger = logging.getLogger(__name__)
 
+MIC_CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'mic_cal.json')
+MIC_CALIBRATION_MAX_AGE_SECONDS = 24 * 60 * 60
+RECOGNIZER_JOIN_TIMEOUT_SECONDS = 30.0
+
 class VoiceCommandHandler:
-    def __init__(self):
+    def __init__(self, calibration_path: str = MIC_CALIBRATION_PATH):
         self.recognizer = sr.Recognizer()
+        self.recognizer.pause_threshold = 2.0
         self.microphone = sr.Microphone()
+        self.calibration_path = calibration_path
+        self._audio_queue: "queue.Queue[Optional[sr.AudioData]]" = queue.Queue()
+        self._recognizer_thread: Optional[threading.Thread] = None
+        self._on_text: Optional[Callable[[Optional[str]], None]] = None
+
+        cached_threshold = self._load_calibration()
+        if cached_threshold is not None:
+            # dynamic thresholding keeps adapting from the cached level while listening
+            self.recognizer.energy_threshold = cached_threshold
+            self.recognizer.dynamic_energy_threshold = True
+            logger.info(f"Using cached microphone calibration (energy_threshold={cached_threshold:.1f}).")
+            return
+
         try:
             with self.microphone as source:
                 logger.info("Adjusting microphone for ambient noise... please wait.")
                 self.recognizer.adjust_for_ambient_noise(source, duration=1)
-                self.recognizer.pause_threshold = 2.0
                 logger.info("Microphone adjusted.")
         except Exception as e:
             logger.error(f"Failed to access microphone or adjust for ambient noise: {e}", exc_info=True)
             self.microphone = None
+            return
+        self._save_calibration(self.recognizer.energy_threshold)
+
+    def _load_calibration(self) -> Optional[float]:
+        try:
+            with open(self.calibration_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            threshold = float(data["energy_threshold"])
+            age_seconds = time.time() - float(data["timestamp"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable microphone calibration file {self.calibration_path}: {e}")
+            return None
+        if not 0 <= age_seconds < MIC_CALIBRATION_MAX_AGE_SECONDS or threshold <= 0:
+            logger.info("Cached microphone calibration is stale; recalibrating.")
+            return None
+        return threshold
+
+    def _save_calibration(self, energy_threshold: float) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.calibration_path), exist_ok=True)
+            with open(self.calibration_path, 'w', encoding='utf-8') as f:
+                json.dump({"energy_threshold": energy_threshold, "timestamp": time.time()}, f)
+        except OSError as e:
+            logger.warning(f"Could not save microphone calibration to {self.calibration_path}: {e}")
 
     def listen_and_transcribe(self) -> Optional[str]:
+        audio = self._capture_audio()
+        if audio is None:
+            return None
+        return self._transcribe(audio)
+
+    # captures on the calling thread; recognition and on_text run on the recognizer worker
+    def listen_in_background(self, on_text: Callable[[Optional[str]], None]) -> bool:
+        audio = self._capture_audio()
+        if audio is None:
+            return False
+        self._on_text = on_text
+        if self._recognizer_thread is None or not self._recognizer_thread.is_alive():
+            self._recognizer_thread = threading.Thread(target=self._recognizer_worker, name="voice-recognizer", daemon=True)
+            self._recognizer_thread.start()
+        self._audio_queue.put(audio)
+        return True
+
+    def close(self, timeout: float = RECOGNIZER_JOIN_TIMEOUT_SECONDS) -> None:
+        # on_text may still be running a full chat turn; let it finish before the caller tears down shared state
+        if self._recognizer_thread is None or not self._recognizer_thread.is_alive():
+            return
+        self._audio_queue.put(None)
+        if self._recognizer_thread is threading.current_thread():
+            return
+        self._recognizer_thread.join(timeout)
+        if self._recognizer_thread.is_alive():
+            logger.warning(f"Voice recognizer worker still busy after {timeout:g}s; continuing shutdown.")
+
+    def _recognizer_worker(self) -> None:
+        while True:
+            audio = self._audio_queue.get()
+            if audio is None:
+                return
+            text = self._transcribe(audio)
+            try:
+                if self._on_text:
+                    self._on_text(text)
+            except Exception as e_callback:
+                logger.error(f"Error in voice transcription callback: {e_callback}", exc_info=True)
+
+    def _capture_audio(self) -> Optional["sr.AudioData"]:
         if not self.microphone:
             logger.error("Microphone not available for voice input.")
             return None
@@ -27,7 +111,7 @@ class VoiceCommandHandler:
             logger.info("Listening for voice command ...")
             print("(Listening for your command...)")
             try:
-                audio = self.recognizer.listen(source, timeout=7, phrase_time_limit=45) 
+                return self.recognizer.listen(source, timeout=7, phrase_time_limit=45)
             except sr.WaitTimeoutError:
                 logger.info("No speech detected within the initial timeout.")
                 print("(No speech detected)")
@@ -37,6 +121,7 @@ class VoiceCommandHandler:
                 print("(Error during listening)")
                 return None
 
+    def _transcribe(self, audio: "sr.AudioData") -> Optional[str]:
         logger.info("Processing voice command...")
         print("(Processing your command...)")
         try: